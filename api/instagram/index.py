@@ -1,13 +1,18 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import instaloader
 import requests
 import base64
+import json
 import re
 import time
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from urllib.parse import urlparse, urljoin
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS"], "allow_headers": ["Content-Type"]}})
+CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS"], "allow_headers": ["Content-Type", "Range"], "expose_headers": ["Content-Length", "Content-Range", "Accept-Ranges"]}})
 
 BROWSER_HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
@@ -17,6 +22,16 @@ BROWSER_HEADERS = {
     'Origin': 'https://www.instagram.com',
 }
 
+# Shared session so CDN fetches reuse pooled keep-alive connections
+MEDIA_FETCH_WORKERS = 4
+media_session = requests.Session()
+media_session.mount('https://', requests.adapters.HTTPAdapter(
+    pool_connections=4, pool_maxsize=MEDIA_FETCH_WORKERS * 2))
+
+STREAM_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+MAX_BUNDLE_ITEMS = 20
+
 def get_instaloader():
     """Create a fresh Instaloader instance per request to avoid stale sessions"""
     loader = instaloader.Instaloader(
@@ -33,7 +48,7 @@ def get_instaloader():
 def fetch_image_as_base64(url):
     """Fetch an image and convert to base64 data URL"""
     try:
-        response = requests.get(url, headers=BROWSER_HEADERS, timeout=10)
+        response = media_session.get(url, headers=BROWSER_HEADERS, timeout=10)
         if response.status_code == 200:
             content_type = response.headers.get('Content-Type', 'image/jpeg')
             base64_data = base64.b64encode(response.content).decode('utf-8')
@@ -42,9 +57,19 @@ def fetch_image_as_base64(url):
         print(f'Failed to fetch image as base64: {e}')
     return None
 
+def build_media_item(media_type, url, display_url, with_thumbnail=True):
+    """Build one media entry, inlining the thumbnail as base64 to avoid CORS"""
+    thumbnail_base64 = fetch_image_as_base64(display_url) if with_thumbnail else None
+    return {
+        'type': media_type,
+        'url_high': url,
+        'url_low': url,
+        'thumbnail': thumbnail_base64 or display_url
+    }
+
 
 # ── Fallback 1: Instagram embed page scraping ─────────────────────
-def fetch_via_embed_page(shortcode):
+def fetch_via_embed_page(shortcode, with_thumbnails=True):
     """Scrape the Instagram embed page for all carousel media.
     The embed page is less aggressively rate-limited than the GraphQL API
     and contains data for all items in a carousel post."""
@@ -106,44 +131,21 @@ def fetch_via_embed_page(shortcode):
                     if not display_url:
                         continue
 
-                    thumbnail_base64 = fetch_image_as_base64(display_url)
-
                     if is_video:
                         video_url = node.get('video_url', display_url)
-                        media.append({
-                            'type': 'video',
-                            'url_high': video_url,
-                            'url_low': video_url,
-                            'thumbnail': thumbnail_base64 or display_url
-                        })
+                        media.append(build_media_item('video', video_url, display_url, with_thumbnails))
                     else:
-                        media.append({
-                            'type': 'image',
-                            'url_high': display_url,
-                            'url_low': display_url,
-                            'thumbnail': thumbnail_base64 or display_url
-                        })
+                        media.append(build_media_item('image', display_url, display_url, with_thumbnails))
             else:
                 # Single post from JSON
                 is_video = shortcode_media.get('is_video', False)
                 display_url = shortcode_media.get('display_url', '')
                 if display_url:
-                    thumbnail_base64 = fetch_image_as_base64(display_url)
                     if is_video:
                         video_url = shortcode_media.get('video_url', display_url)
-                        media.append({
-                            'type': 'video',
-                            'url_high': video_url,
-                            'url_low': video_url,
-                            'thumbnail': thumbnail_base64 or display_url
-                        })
+                        media.append(build_media_item('video', video_url, display_url, with_thumbnails))
                     else:
-                        media.append({
-                            'type': 'image',
-                            'url_high': display_url,
-                            'url_low': display_url,
-                            'thumbnail': thumbnail_base64 or display_url
-                        })
+                        media.append(build_media_item('image', display_url, display_url, with_thumbnails))
 
     # Strategy 2: If JSON parsing didn't work, try scraping image URLs from HTML
     if not media:
@@ -171,6 +173,10 @@ def fetch_via_embed_page(shortcode):
         if full_urls:
             print(f'Found {len(full_urls)} images via HTML scraping')
             for img_url in full_urls:
+                if not with_thumbnails:
+                    media.append(build_media_item('image', img_url, img_url, with_thumbnail=False))
+                    continue
+                # Only keep URLs that actually resolve to an image
                 thumbnail_base64 = fetch_image_as_base64(img_url)
                 if thumbnail_base64:
                     media.append({
@@ -223,7 +229,7 @@ def fetch_via_oembed(shortcode):
 
 
 # ── Primary: instaloader approach ──────────────────────────────────
-def fetch_via_instaloader(shortcode):
+def fetch_via_instaloader(shortcode, with_thumbnails=True):
     """Primary approach using instaloader's GraphQL queries."""
     last_error = None
     for attempt in range(2):
@@ -238,39 +244,16 @@ def fetch_via_instaloader(shortcode):
                 print(f'Found carousel with {post.mediacount} items')
                 for i, node in enumerate(post.get_sidecar_nodes()):
                     display_url = node.display_url
-                    thumbnail_base64 = fetch_image_as_base64(display_url)
                     if node.is_video:
-                        media.append({
-                            'type': 'video',
-                            'url_high': node.video_url,
-                            'url_low': node.video_url,
-                            'thumbnail': thumbnail_base64 or display_url
-                        })
+                        media.append(build_media_item('video', node.video_url, display_url, with_thumbnails))
                     else:
-                        media.append({
-                            'type': 'image',
-                            'url_high': display_url,
-                            'url_low': display_url,
-                            'thumbnail': thumbnail_base64 or display_url
-                        })
+                        media.append(build_media_item('image', display_url, display_url, with_thumbnails))
             elif post.typename == 'GraphImage':
                 img_url = post.url
-                thumbnail_base64 = fetch_image_as_base64(img_url)
-                media.append({
-                    'type': 'image',
-                    'url_high': img_url,
-                    'url_low': img_url,
-                    'thumbnail': thumbnail_base64 or img_url
-                })
+                media.append(build_media_item('image', img_url, img_url, with_thumbnails))
             elif post.typename == 'GraphVideo':
                 video_url = post.video_url
-                thumbnail_base64 = fetch_image_as_base64(post.url)
-                media.append({
-                    'type': 'video',
-                    'url_high': video_url,
-                    'url_low': video_url,
-                    'thumbnail': thumbnail_base64 or post.url
-                })
+                media.append(build_media_item('video', video_url, post.url, with_thumbnails))
             
             if media:
                 return media
@@ -284,37 +267,23 @@ def fetch_via_instaloader(shortcode):
     
     raise last_error
 
-@app.route('/api/instagram', methods=['GET', 'OPTIONS'])
-def get_instagram():
-    if request.method == 'OPTIONS':
-        return '', 204
-    
-    url = request.args.get('url')
-    if not url:
-        return jsonify({'error': 'URL parameter required'}), 400
-    
-    match = re.search(r'/(p|reel)/([A-Za-z0-9_-]+)', url)
-    if not match:
-        return jsonify({'error': 'Invalid Instagram URL'}), 400
-    
-    shortcode = match.group(2)
-    print(f'\n=== Fetching Instagram post: {shortcode} ===')
-    
+def resolve_media(shortcode, with_thumbnails=True):
+    """Try instaloader, then the embed page, then oEmbed; returns a media list or None"""
     # 1) Try instaloader (full quality, carousel support)
     try:
-        media = fetch_via_instaloader(shortcode)
+        media = fetch_via_instaloader(shortcode, with_thumbnails)
         if media:
             print(f'=== Instaloader success: {len(media)} items ===\n')
-            return jsonify({'success': True, 'media': media})
+            return media
     except Exception as e:
         print(f'Instaloader failed, trying embed page fallback: {e}')
     
     # 2) Try embed page scraping (carousel support, less rate-limited)
     try:
-        media = fetch_via_embed_page(shortcode)
+        media = fetch_via_embed_page(shortcode, with_thumbnails)
         if media:
             print(f'=== Embed page fallback success: {len(media)} items ===\n')
-            return jsonify({'success': True, 'media': media})
+            return media
     except Exception as e:
         print(f'Embed page fallback failed, trying oEmbed: {e}')
     
@@ -323,10 +292,263 @@ def get_instagram():
         media = fetch_via_oembed(shortcode)
         if media:
             print(f'=== oEmbed fallback success: {len(media)} items ===\n')
-            return jsonify({'success': True, 'media': media})
+            return media
     except Exception as e:
         print(f'oEmbed fallback also failed: {e}')
     
-    return jsonify({
-        'error': 'Could not retrieve media from this Instagram post. Instagram may be blocking requests. Please try again in a few minutes.'
-    }), 502
+    return None
+
+# ── Progressive (NDJSON) responses ─────────────────────────────────
+def ndjson_line(obj):
+    return json.dumps(obj, separators=(',', ':')) + '\n'
+
+def inline_thumbnail(item):
+    """Copy of an item with its thumbnail inlined as base64; the item itself keeps the URL"""
+    if item['thumbnail'].startswith('data:'):
+        return item
+    return {**item, 'thumbnail': fetch_image_as_base64(item['thumbnail']) or item['thumbnail']}
+
+def stream_media_items(shortcode, media):
+    """Yield a meta line with the item count, then each item as soon as its
+    thumbnail is inlined, then a done line. Items carry their index."""
+    yield ndjson_line({'type': 'meta', 'shortcode': shortcode, 'count': len(media)})
+    pool = ThreadPoolExecutor(max_workers=MEDIA_FETCH_WORKERS)
+    futures = {pool.submit(inline_thumbnail, item): i for i, item in enumerate(media)}
+    try:
+        for future in as_completed(futures):
+            # Drop our reference so the image bytes go once the line is written
+            yield ndjson_line({'type': 'item', 'index': futures.pop(future), 'media': future.result()})
+        yield ndjson_line({'type': 'done', 'count': len(media)})
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+BLOCKED_ERROR = 'Could not retrieve media from this Instagram post. Instagram may be blocking requests. Please try again in a few minutes.'
+
+@app.route('/api/instagram', methods=['GET', 'OPTIONS'])
+def get_instagram():
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    url = request.args.get('url')
+    if not url:
+        return jsonify({'error': 'URL parameter required'}), 400
+    
+    match = re.search(r'/(p|reel)/([A-Za-z0-9_-]+)', url)
+    if not match:
+        return jsonify({'error': 'Invalid Instagram URL'}), 400
+    
+    shortcode = match.group(2)
+    print(f'\n=== Fetching Instagram post: {shortcode} ===')
+    
+    if request.args.get('stream') == '1':
+        # Resolve URLs only; thumbnails are inlined while the response streams
+        media = resolve_media(shortcode, with_thumbnails=False)
+        if not media:
+            return jsonify({'error': BLOCKED_ERROR}), 502
+        return Response(stream_media_items(shortcode, media), mimetype='application/x-ndjson')
+    
+    media = resolve_media(shortcode)
+    if media:
+        return jsonify({'success': True, 'media': media})
+    
+    return jsonify({'error': BLOCKED_ERROR}), 502
+
+
+# ── Carousel ZIP bundle ────────────────────────────────────────────
+class ZipStream:
+    """Write-only sink for zipfile that hands written bytes back to a generator"""
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+def spool_media(url):
+    """Download a media URL into a spooled temp file; returns (file, size)"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    try:
+        with media_session.get(url, headers=BROWSER_HEADERS, timeout=15, stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                spooled.write(chunk)
+        size = spooled.tell()
+        spooled.seek(0)
+        return spooled, size
+    except Exception:
+        spooled.close()
+        raise
+
+def discard_spool(future):
+    """Close a finished fetch's spooled file once nobody is going to write it"""
+    if not future.cancelled() and future.exception() is None:
+        future.result()[0].close()
+
+def stream_media_zip(entries):
+    """Yield a stored (uncompressed) ZIP of (name, url) entries.
+    At most MEDIA_FETCH_WORKERS items are fetched ahead of the writer, and the
+    next fetch only starts once a finished item has been written, so a slow
+    client throttles the fetching instead of the archive piling up in memory."""
+    sink = ZipStream()
+    pool = ThreadPoolExecutor(max_workers=MEDIA_FETCH_WORKERS)
+    remaining = iter(entries)
+    in_flight = {}
+
+    def fetch_next():
+        for name, url in remaining:
+            in_flight[pool.submit(spool_media, url)] = name
+            return
+
+    for _ in range(MEDIA_FETCH_WORKERS):
+        fetch_next()
+    try:
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as zf:
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = in_flight.pop(future)
+                    try:
+                        spooled, size = future.result()
+                    except Exception as e:
+                        print(f'Skipping {name}: {e}')
+                        fetch_next()
+                        continue
+                    with spooled:
+                        zinfo = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                        zinfo.compress_type = zipfile.ZIP_STORED
+                        zinfo.file_size = size
+                        with zf.open(zinfo, 'w') as dest:
+                            while chunk := spooled.read(STREAM_CHUNK_SIZE):
+                                dest.write(chunk)
+                                yield from sink.drain()
+                    yield from sink.drain()
+                    fetch_next()
+        yield from sink.drain()
+    finally:
+        # Client may have disconnected: stop queued fetches and drop their spools,
+        # including those of fetches still running
+        pool.shutdown(wait=False, cancel_futures=True)
+        for future in in_flight:
+            future.add_done_callback(discard_spool)
+
+@app.route('/api/instagram/bundle', methods=['GET', 'OPTIONS'])
+def bundle_instagram():
+    """Stream selected carousel items as a single ZIP download"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    shortcode = request.args.get('shortcode')
+    if not shortcode:
+        match = re.search(r'/(p|reel)/([A-Za-z0-9_-]+)', request.args.get('url', ''))
+        shortcode = match.group(2) if match else None
+    if not shortcode or not re.fullmatch(r'[A-Za-z0-9_-]+', shortcode):
+        return jsonify({'error': 'shortcode or url parameter required'}), 400
+    
+    try:
+        indices = [int(i) for i in request.args.get('indices', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify({'error': 'indices must be a comma-separated list of numbers'}), 400
+    video_ext = request.args.get('video_ext', 'mp4')
+    if not re.fullmatch(r'[a-z0-9]{1,5}', video_ext):
+        video_ext = 'mp4'
+    
+    print(f'\n=== Bundling Instagram post: {shortcode} ===')
+    media = resolve_media(shortcode, with_thumbnails=False)
+    if not media:
+        return jsonify({'error': BLOCKED_ERROR}), 502
+    
+    if not indices:
+        indices = list(range(len(media)))
+    indices = sorted(set(indices))[:MAX_BUNDLE_ITEMS]
+    if any(i < 0 or i >= len(media) for i in indices):
+        return jsonify({'error': f'indices must be between 0 and {len(media) - 1}'}), 400
+    
+    entries = []
+    for i in indices:
+        item = media[i]
+        ext = video_ext if item['type'] == 'video' else 'jpg'
+        entries.append((f'instagram_{i + 1}.{ext}', item['url_high']))
+    
+    return Response(
+        stream_media_zip(entries),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="instagram_{shortcode}.zip"'}
+    )
+
+
+# ── Media proxy ────────────────────────────────────────────────────
+PROXY_ALLOWED_HOSTS = ('cdninstagram.com', 'fbcdn.net')
+PROXY_PASSTHROUGH_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges', 'Last-Modified', 'ETag')
+
+def is_proxyable_media_url(url):
+    """Only proxy https URLs on Instagram's CDNs so this can't be used as an open proxy"""
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    return parsed.scheme == 'https' and any(host == h or host.endswith('.' + h) for h in PROXY_ALLOWED_HOSTS)
+
+MAX_PROXY_REDIRECTS = 3
+
+def fetch_proxied_media(url, headers):
+    """GET a CDN URL, following redirects only while they stay on allowed hosts.
+    Returns the upstream response, or None if a redirect leaves the CDN."""
+    for _ in range(MAX_PROXY_REDIRECTS + 1):
+        upstream = media_session.get(url, headers=headers, timeout=15, stream=True, allow_redirects=False)
+        if not upstream.is_redirect:
+            return upstream
+        upstream.close()
+        url = urljoin(url, upstream.headers['Location'])
+        if not is_proxyable_media_url(url):
+            return None
+    raise requests.TooManyRedirects(f'More than {MAX_PROXY_REDIRECTS} redirects')
+
+@app.route('/api/instagram/media', methods=['GET', 'OPTIONS'])
+def proxy_instagram_media():
+    """Stream a CDN image/video through our server, forwarding Range requests"""
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    url = request.args.get('url')
+    if not url:
+        return jsonify({'error': 'URL parameter required'}), 400
+    if not is_proxyable_media_url(url):
+        return jsonify({'error': 'Only Instagram CDN URLs can be proxied'}), 400
+
+    # Ask for the raw bytes so Content-Length/Content-Range still match what we send
+    upstream_headers = {**BROWSER_HEADERS, 'Accept-Encoding': 'identity'}
+    for name in ('Range', 'If-Range'):
+        if name in request.headers:
+            upstream_headers[name] = request.headers[name]
+
+    try:
+        upstream = fetch_proxied_media(url, upstream_headers)
+    except requests.RequestException as e:
+        print(f'Media proxy error: {e}')
+        return jsonify({'error': 'Failed to reach Instagram CDN'}), 502
+    if upstream is None:
+        return jsonify({'error': 'Instagram CDN redirected outside its domains'}), 502
+
+    if upstream.status_code not in (200, 206, 416):
+        upstream.close()
+        return jsonify({'error': f'Instagram CDN returned {upstream.status_code}'}), 502
+
+    headers = {name: upstream.headers[name] for name in PROXY_PASSTHROUGH_HEADERS if name in upstream.headers}
+    filename = request.args.get('filename')
+    if filename:
+        safe_name = re.sub(r'[^A-Za-z0-9._-]', '_', filename)
+        headers['Content-Disposition'] = f'attachment; filename="{safe_name}"'
+
+    def generate():
+        try:
+            for chunk in upstream.iter_content(STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            upstream.close()
+
+    return Response(generate(), status=upstream.status_code, headers=headers)
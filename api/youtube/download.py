@@ -1,14 +1,155 @@
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import yt_dlp
+from yt_dlp.utils import download_range_func, parse_duration
 import re
 import traceback
 import tempfile
 import os
+import shutil
+import threading
+import time
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS"], "allow_headers": ["Content-Type"]}})
 
+# Rough bitrates used when yt-dlp doesn't report a filesize
+BITRATE_ESTIMATES_KBPS = {
+    144: 200, 240: 400, 360: 800,
+    480: 1500, 720: 2500, 1080: 4500
+}
+
+# ── Download admission control ─────────────────────────────────────
+# /tmp is 512 MB on Vercel, so cap concurrent downloads and the scratch
+# space they may reserve; anything over the budget waits or is rejected.
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get('UTH_MAX_CONCURRENT_DOWNLOADS', 2))
+MAX_QUEUED_DOWNLOADS = int(os.environ.get('UTH_MAX_QUEUED_DOWNLOADS', 4))
+DOWNLOAD_QUEUE_TIMEOUT = float(os.environ.get('UTH_DOWNLOAD_QUEUE_TIMEOUT', 20))
+DOWNLOAD_DISK_BUDGET = int(os.environ.get('UTH_DOWNLOAD_DISK_BUDGET_MB', 400)) * 1024 * 1024
+DEFAULT_DOWNLOAD_ESTIMATE = 100 * 1024 * 1024
+SCRATCH_PREFIX = 'uth-dl-'
+SCRATCH_MAX_AGE = int(os.environ.get('UTH_SCRATCH_MAX_AGE', 3600))
+
+_admission = threading.Condition()
+_active_downloads = 0
+_queued_downloads = 0
+_reserved_bytes = 0
+
+class DownloadRejected(Exception):
+    """Raised when a download can't be admitted; carries the HTTP status to return"""
+    def __init__(self, message, status=503):
+        super().__init__(message)
+        self.status = status
+
+def estimate_filesize(fmt, duration):
+    """Return (size_in_bytes, is_estimate) for a format, or (None, True) if unknown"""
+    filesize = fmt.get('filesize') or fmt.get('filesize_approx')
+    if filesize and filesize > 0:
+        return filesize, False
+    height = fmt.get('height')
+    if duration and height:
+        bitrate_kbps = BITRATE_ESTIMATES_KBPS.get(height, 1000)
+        return int(bitrate_kbps * duration / 8 * 1024), True
+    return None, True
+
+def estimate_media_bytes(info):
+    """Estimate the combined size of a download's selected formats"""
+    duration = info.get('duration', 0)
+    total = 0
+    for fmt in info.get('requested_formats') or [info]:
+        size, _ = estimate_filesize(fmt, duration)
+        total += size or 0
+    return total or DEFAULT_DOWNLOAD_ESTIMATE
+
+def estimate_download_bytes(info, clip_share=None):
+    """Estimate the scratch space a download needs; clip_share is the part of
+    the video a clip covers (see clip_fraction), None for the whole video"""
+    if clip_share is not None:
+        # Clips go through ffmpeg, which writes video and audio straight into
+        # one output file: there are no separate inputs to merge
+        return int(estimate_media_bytes(info) * clip_share)
+    total = estimate_media_bytes(info)
+    # Merging separate video/audio streams writes the output next to its inputs
+    if info.get('requested_formats'):
+        total *= 2
+    return int(total)
+
+def parse_clip_range(start, end):
+    """Parse clip start/end (seconds or [HH:]MM:SS) into seconds; end may be open"""
+    start_s = parse_duration(start) if start else 0
+    end_s = parse_duration(end) if end else float('inf')
+    if start_s is None or end_s is None:
+        raise DownloadRejected('start and end must be seconds or [HH:]MM:SS', 400)
+    if end_s <= start_s:
+        raise DownloadRejected('end must be after start', 400)
+    return start_s, end_s
+
+def clip_fraction(clip, duration):
+    """Share of the video a clip covers; rejects clips that start past the end"""
+    start_s, end_s = clip
+    if not duration:
+        return 1.0
+    if start_s >= duration:
+        raise DownloadRejected(f'start is past the end of the video ({duration}s)', 400)
+    # Keyframe snapping can pull in a little extra on either side
+    return min(1.0, (min(end_s, duration) - start_s) / duration * 1.1)
+
+def admit_download(nbytes, timeout=DOWNLOAD_QUEUE_TIMEOUT):
+    """Wait for a free download slot and reserve nbytes of scratch space"""
+    global _active_downloads, _queued_downloads, _reserved_bytes
+    if nbytes > DOWNLOAD_DISK_BUDGET:
+        raise DownloadRejected(
+            f'Video is too large to download here ({nbytes / (1024*1024):.0f} MB). Try a lower quality.', 413)
+    with _admission:
+        if _queued_downloads >= MAX_QUEUED_DOWNLOADS:
+            raise DownloadRejected('Server is busy with other downloads. Please try again shortly.')
+        _queued_downloads += 1
+        try:
+            admitted = _admission.wait_for(
+                lambda: _active_downloads < MAX_CONCURRENT_DOWNLOADS
+                and _reserved_bytes + nbytes <= DOWNLOAD_DISK_BUDGET,
+                timeout=timeout)
+        finally:
+            _queued_downloads -= 1
+        if not admitted:
+            raise DownloadRejected('Server is busy with other downloads. Please try again shortly.')
+        _active_downloads += 1
+        _reserved_bytes += nbytes
+
+def release_download_slot():
+    """Free a concurrency slot once yt-dlp has finished writing"""
+    global _active_downloads
+    with _admission:
+        _active_downloads -= 1
+        _admission.notify_all()
+
+def release_scratch(temp_dir, nbytes):
+    """Remove a download's scratch directory and return its reserved bytes"""
+    global _reserved_bytes
+    if temp_dir:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    if nbytes:
+        with _admission:
+            _reserved_bytes -= nbytes
+            _admission.notify_all()
+
+def remove_orphaned_scratch_dirs(max_age=SCRATCH_MAX_AGE):
+    """Delete scratch directories left behind by timed-out invocations"""
+    root = tempfile.gettempdir()
+    now = time.time()
+    for name in os.listdir(root):
+        if not name.startswith(SCRATCH_PREFIX):
+            continue
+        path = os.path.join(root, name)
+        try:
+            if now - os.path.getmtime(path) < max_age:
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+remove_orphaned_scratch_dirs()
+
 @app.route('/api/youtube/download', methods=['GET', 'OPTIONS'])
 def download_youtube():
     """Download YouTube video using yt-dlp and stream to client"""
@@ -18,11 +159,20 @@ def download_youtube():
     video_url = request.args.get('url')
     quality = request.args.get('quality', '360p')
     filename = request.args.get('filename', 'video.mp4')
+    # Optional clip: only the fragments/byte ranges covering start..end are fetched
+    start = request.args.get('start')
+    end = request.args.get('end')
+    precise = request.args.get('precise') == '1'
     
     if not video_url:
         return jsonify({'error': 'URL parameter required'}), 400
     
+    temp_dir = None
+    reserved = 0
+
     try:
+        clip = parse_clip_range(start, end) if (start or end) else None
+
         video_id_match = re.search(r'(?:v=|/)([a-zA-Z0-9_-]{11})', video_url)
         if video_id_match:
             video_id = video_id_match.group(1)
@@ -31,7 +181,7 @@ def download_youtube():
         height = quality.replace('p', '')
         format_string = f'bestvideo[height<={height}]+bestaudio/best[height<={height}]'
         
-        temp_dir = tempfile.mkdtemp()
+        temp_dir = tempfile.mkdtemp(prefix=SCRATCH_PREFIX)
         output_path = os.path.join(temp_dir, 'video.%(ext)s')
         
         ydl_opts = {
@@ -43,25 +193,58 @@ def download_youtube():
             'socket_timeout': 30,
         }
         
+        if clip:
+            # Cuts snap to keyframes so streams are copied, not re-encoded,
+            # unless the caller asks for frame-accurate (re-encoded) cuts
+            ydl_opts['download_ranges'] = download_range_func(None, [clip])
+            ydl_opts['force_keyframes_at_cuts'] = precise
+
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([video_url])
+            info = ydl.extract_info(video_url, download=False)
+            full_size = estimate_media_bytes(info)
+            clip_share = clip_fraction(clip, info.get('duration')) if clip else None
+            needed = estimate_download_bytes(info, clip_share)
+            admit_download(needed)
+            reserved = needed
+            try:
+                ydl.process_ie_result(info, download=True)
+            finally:
+                release_download_slot()
         
         downloaded_files = [f for f in os.listdir(temp_dir) if f.startswith('video.')]
         if not downloaded_files:
             raise Exception('No file was downloaded')
         
         downloaded_file = os.path.join(temp_dir, downloaded_files[0])
-        if os.path.getsize(downloaded_file) == 0:
+        file_size = os.path.getsize(downloaded_file)
+        if file_size == 0:
             raise Exception('Downloaded file is empty')
         
-        return send_file(
+        response = send_file(
             downloaded_file,
             mimetype='video/mp4',
             as_attachment=True,
             download_name=filename
         )
+        # Size of the file we send vs. the whole video; yt-dlp's ffmpeg
+        # downloader (used for clips) reports only output size, not transfer
+        response.headers['X-Output-Size'] = str(file_size)
+        response.headers['X-Full-Size-Estimate'] = str(full_size)
+        # send_file sets direct_passthrough, which makes Werkzeug skip the
+        # response's close callbacks; iterate the file normally so the
+        # scratch dir and its reservation are released when the stream ends
+        response.direct_passthrough = False
+        scratch_dir, scratch_bytes = temp_dir, reserved
+        response.call_on_close(lambda: release_scratch(scratch_dir, scratch_bytes))
+        return response
+
+    except DownloadRejected as e:
+        release_scratch(temp_dir, reserved)
+        headers = {'Retry-After': str(int(DOWNLOAD_QUEUE_TIMEOUT))} if e.status == 503 else {}
+        return jsonify({'error': str(e)}), e.status, headers
             
     except Exception as e:
+        release_scratch(temp_dir, reserved)
         print(f'Download error: {str(e)}')
         print(f'Traceback: {traceback.format_exc()}')
         return jsonify({'error': f'Download failed: {str(e)}'}), 500
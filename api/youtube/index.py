@@ -3,6 +3,9 @@ from flask_cors import CORS
 import yt_dlp
 import re
 import traceback
+import os
+import queue
+from contextlib import contextmanager
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS"], "allow_headers": ["Content-Type"]}})
@@ -16,6 +19,60 @@ def get_ydl_opts():
         'socket_timeout': 30,
     }
 
+# ── Pooled YoutubeDL instances ─────────────────────────────────────
+# Warm invocations reuse pre-built instances instead of re-parsing options
+# and reloading extractors. Recycled after YDL_MAX_USES requests or any error.
+YDL_POOL_SIZE = int(os.environ.get('UTH_YDL_POOL_SIZE', 2))
+YDL_MAX_USES = int(os.environ.get('UTH_YDL_MAX_USES', 100))
+
+# Per-call counters YoutubeDL keeps on the instance
+YDL_RESET_STATE = {'_download_retcode': 0, '_num_downloads': 0, '_num_videos': 0, '_playlist_level': 0}
+
+_ydl_pool = queue.LifoQueue(maxsize=YDL_POOL_SIZE)
+
+def new_ydl():
+    """Build an info-extraction YoutubeDL and pay its one-off setup costs up front"""
+    ydl = yt_dlp.YoutubeDL(get_ydl_opts())
+    ydl.get_info_extractor('Youtube')
+    ydl.cookiejar  # created lazily on first access
+    return ydl
+
+def reset_ydl(ydl):
+    """Clear per-call state so the next request starts clean"""
+    for name, value in YDL_RESET_STATE.items():
+        if hasattr(ydl, name):
+            setattr(ydl, name, value)
+    for name in ('_playlist_urls', '_printed_messages'):
+        getattr(ydl, name, set()).clear()
+
+@contextmanager
+def pooled_ydl():
+    """Check out a warm YoutubeDL, falling back to a fresh one if the pool is busy"""
+    try:
+        # Never wait: building a fresh instance (~80 ms) beats queueing for one
+        entry = _ydl_pool.get_nowait()
+    except queue.Empty:
+        entry = [new_ydl(), 0]
+    ydl = entry[0]
+    healthy = False
+    try:
+        yield ydl
+        healthy = True
+    finally:
+        entry[1] += 1
+        if healthy and entry[1] < YDL_MAX_USES:
+            reset_ydl(ydl)
+            try:
+                _ydl_pool.put_nowait(entry)
+            except queue.Full:
+                ydl.close()
+        else:
+            ydl.close()
+
+# Warm the pool during cold start so the first request doesn't pay for it
+while not _ydl_pool.full():
+    _ydl_pool.put_nowait([new_ydl(), 0])
+
 @app.route('/api/youtube', methods=['GET', 'OPTIONS'])
 def get_youtube():
     if request.method == 'OPTIONS':
@@ -32,9 +89,7 @@ def get_youtube():
         url = f'https://www.youtube.com/watch?v={video_id}'
     
     try:
-        ydl_opts = get_ydl_opts()
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with pooled_ydl() as ydl:
             info = ydl.extract_info(url, download=False)
             
             video_data = {
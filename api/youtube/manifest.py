@@ -0,0 +1,194 @@
+from flask import Flask, request, jsonify, Response
+from flask_cors import CORS
+import yt_dlp
+import re
+import struct
+import requests
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+app = Flask(__name__)
+CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS"], "allow_headers": ["Content-Type"]}})
+
+def get_ydl_opts():
+    """Get yt-dlp options optimized for serverless environments"""
+    return {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': False,
+        'socket_timeout': 30,
+    }
+
+# extract_info already lists every separate video/audio stream. Wrapping
+# them in an MPD lets a browser player (dash.js, Shaka) preview any quality
+# straight from the CDN with adaptive switching; we only serve the manifest.
+MPD_PROFILE = 'urn:mpeg:dash:profile:isoff-on-demand:2011'
+MPD_AUDIO_CHANNELS_SCHEME = 'urn:mpeg:dash:23003:3:audio_channel_configuration:2011'
+MP4_PROBE_BYTES = 16 * 1024
+MANIFEST_MAX_HEIGHT = 2160
+PROBE_WORKERS = 4
+
+# Shared session so index probes reuse keep-alive connections
+probe_session = requests.Session()
+
+def find_mp4_index_range(fmt):
+    """Locate a single-file fragmented MP4's init segment and sidx box.
+    yt-dlp doesn't keep YouTube's initRange/indexRange, so read the top-level
+    box headers from the first few KB. Returns (init_end, index_start, index_end)."""
+    headers = {**(fmt.get('http_headers') or {}), 'Range': f'bytes=0-{MP4_PROBE_BYTES - 1}'}
+    data = b''
+    with probe_session.get(fmt['url'], headers=headers, timeout=10, stream=True) as response:
+        if response.status_code not in (200, 206):
+            return None
+        for chunk in response.iter_content(MP4_PROBE_BYTES):
+            data += chunk
+            if len(data) >= MP4_PROBE_BYTES:
+                break
+
+    offset = 0
+    while offset + 8 <= len(data):
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        if size == 1 and offset + 16 <= len(data):
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+        if box_type == b'sidx':
+            return offset - 1, offset, offset + size - 1
+        if size < 8:
+            break
+        offset += size
+    return None
+
+def manifest_stream(fmt, ranges, duration):
+    """Keep just what an MPD Representation needs from a yt-dlp format"""
+    init_end, index_start, index_end = ranges
+    bandwidth = (fmt.get('tbr') or 0) * 1000
+    if not bandwidth and fmt.get('filesize') and duration:
+        bandwidth = fmt['filesize'] * 8 / duration
+    return {
+        'id': fmt['format_id'],
+        'url': fmt['url'],
+        'codecs': fmt.get('vcodec') if fmt.get('vcodec') != 'none' else fmt.get('acodec'),
+        'bandwidth': int(bandwidth) or 1,
+        'width': fmt.get('width'),
+        'height': fmt.get('height'),
+        'fps': fmt.get('fps'),
+        'asr': fmt.get('asr'),
+        'channels': fmt.get('audio_channels'),
+        'language': fmt.get('language'),
+        'init_range': f'0-{init_end}',
+        'index_range': f'{index_start}-{index_end}',
+    }
+
+def resolve_youtube_manifest(video_id):
+    """Extract a video's MP4 DASH streams and their index ranges"""
+    with yt_dlp.YoutubeDL(get_ydl_opts()) as ydl:
+        info = ydl.extract_info(f'https://www.youtube.com/watch?v={video_id}', download=False)
+
+    duration = info.get('duration') or 0
+    candidates = []
+    for fmt in info.get('formats', []):
+        # Only fragmented MP4 (avc1/av01 video, mp4a audio) can be indexed here;
+        # skip DRM, throttled-client and DRC (dynamic range compressed) variants
+        if fmt.get('container') not in ('mp4_dash', 'm4a_dash') or fmt.get('protocol') != 'https':
+            continue
+        if fmt.get('has_drm') or not fmt.get('url') or fmt['format_id'].endswith('-drc'):
+            continue
+        if fmt.get('vcodec') != 'none' and (fmt.get('height') or 0) > MANIFEST_MAX_HEIGHT:
+            continue
+        candidates.append(fmt)
+
+    streams = {'duration': duration, 'video': [], 'audio': []}
+    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+        probes = {pool.submit(find_mp4_index_range, fmt): fmt for fmt in candidates}
+        for future in as_completed(probes):
+            fmt = probes[future]
+            try:
+                ranges = future.result()
+            except Exception as e:
+                print(f'Skipping format {fmt["format_id"]}: {e}')
+                continue
+            if ranges:
+                kind = 'audio' if fmt.get('vcodec') == 'none' else 'video'
+                streams[kind].append(manifest_stream(fmt, ranges, duration))
+
+    if not streams['video'] or not streams['audio']:
+        raise Exception('No DASH streams available for this video')
+    return streams
+
+def add_representation(adaptation_set, stream, attrs):
+    return ET.SubElement(adaptation_set, 'Representation', {
+        'id': stream['id'], 'codecs': stream['codecs'], 'bandwidth': str(stream['bandwidth']), **attrs})
+
+def add_segment_base(rep, stream):
+    ET.SubElement(rep, 'BaseURL').text = stream['url']
+    segment_base = ET.SubElement(rep, 'SegmentBase', {'indexRange': stream['index_range']})
+    ET.SubElement(segment_base, 'Initialization', {'range': stream['init_range']})
+
+def build_mpd(streams, max_height):
+    """Render an on-demand profile MPD: one video AdaptationSet per codec
+    family (players can't switch codecs mid-stream), one audio set per language"""
+    mpd = ET.Element('MPD', {
+        'xmlns': 'urn:mpeg:dash:schema:mpd:2011',
+        'type': 'static',
+        'profiles': MPD_PROFILE,
+        'minBufferTime': 'PT1.5S',
+        'mediaPresentationDuration': f"PT{streams['duration']}S",
+    })
+    period = ET.SubElement(mpd, 'Period', {'id': '0', 'start': 'PT0S'})
+
+    video_sets, audio_sets = {}, {}
+    for stream in streams['video']:
+        if (stream['height'] or 0) <= max_height:
+            video_sets.setdefault(stream['codecs'].split('.')[0], []).append(stream)
+    for stream in streams['audio']:
+        audio_sets.setdefault(stream['language'] or 'und', []).append(stream)
+
+    set_id = 0
+    for family, group in video_sets.items():
+        adaptation_set = ET.SubElement(period, 'AdaptationSet', {
+            'id': str(set_id), 'contentType': 'video', 'mimeType': 'video/mp4',
+            'subsegmentAlignment': 'true', 'subsegmentStartsWithSAP': '1'})
+        set_id += 1
+        for stream in sorted(group, key=lambda s: s['bandwidth']):
+            attrs = {'width': str(stream['width'] or 0), 'height': str(stream['height'] or 0)}
+            if stream['fps']:
+                attrs['frameRate'] = str(stream['fps'])
+            add_segment_base(add_representation(adaptation_set, stream, attrs), stream)
+
+    for language, group in audio_sets.items():
+        adaptation_set = ET.SubElement(period, 'AdaptationSet', {
+            'id': str(set_id), 'contentType': 'audio', 'mimeType': 'audio/mp4', 'lang': language,
+            'subsegmentAlignment': 'true', 'subsegmentStartsWithSAP': '1'})
+        set_id += 1
+        for stream in sorted(group, key=lambda s: s['bandwidth']):
+            attrs = {'audioSamplingRate': str(stream['asr'])} if stream['asr'] else {}
+            rep = add_representation(adaptation_set, stream, attrs)
+            if stream['channels']:
+                ET.SubElement(rep, 'AudioChannelConfiguration', {
+                    'schemeIdUri': MPD_AUDIO_CHANNELS_SCHEME, 'value': str(stream['channels'])})
+            add_segment_base(rep, stream)
+
+    return ET.tostring(mpd, encoding='utf-8', xml_declaration=True)
+
+@app.route('/api/youtube/manifest', methods=['GET', 'OPTIONS'])
+def youtube_manifest():
+    """DASH manifest of a video's streams, for previewing straight from the CDN"""
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    video_id_match = re.search(r'(?:v=|/)([a-zA-Z0-9_-]{11})', request.args.get('url', ''))
+    if not video_id_match:
+        return jsonify({'error': 'YouTube URL parameter required'}), 400
+    try:
+        max_height = int(request.args.get('max_height', 1080))
+    except ValueError:
+        return jsonify({'error': 'max_height must be a number'}), 400
+
+    try:
+        streams = resolve_youtube_manifest(video_id_match.group(1))
+    except Exception as e:
+        print(f'Manifest error: {type(e).__name__}: {str(e)}')
+        return jsonify({'error': f'Failed to build manifest: {str(e)}'}), 500
+
+    if not any((stream['height'] or 0) <= max_height for stream in streams['video']):
+        return jsonify({'error': f'No video streams at or below {max_height}p'}), 404
+    return Response(build_mpd(streams, max_height), mimetype='application/dash+xml')
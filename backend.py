@@ -4,18 +4,350 @@ Combines Instagram and YouTube downloaders for easy local testing
 Run with: python backend.py
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file, Response, g, has_app_context
 from flask_cors import CORS
 import instaloader
 import requests
 import base64
+import json
 import re
 import yt_dlp
+from yt_dlp.extractor import gen_extractor_classes
+from yt_dlp.utils import download_range_func, parse_duration
 import sys
 import traceback
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zipfile
+import hmac
+import random
+import queue
+import heapq
+import itertools
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from urllib.parse import urlparse, urljoin
+import xml.etree.ElementTree as ET
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS"], "allow_headers": ["Content-Type"]}})
+CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS"], "allow_headers": ["Content-Type", "Range", "X-Debug-Token"], "expose_headers": ["Content-Length", "Content-Range", "Accept-Ranges", "X-Output-Size", "X-Full-Size-Estimate", "Server-Timing"]}})
+
+# =============================================================================
+# PROFILING
+# =============================================================================
+# Every request records a cheap stage timeline. Requests slower than the
+# threshold are logged and kept in a ring buffer for /api/admin/slow-requests.
+# A sampled fraction of requests (or any carrying a valid X-Debug-Token)
+# also get a Server-Timing header and, if a trace dir is set, a folded-stack
+# profile that flamegraph.pl / speedscope can render.
+PROFILE_SAMPLE_RATE = float(os.environ.get('UTH_PROFILE_SAMPLE_RATE', 0))
+PROFILE_TRACE_DIR = os.environ.get('UTH_PROFILE_TRACE_DIR', '')
+PROFILE_SAMPLE_INTERVAL = 0.005
+DEBUG_TOKEN = os.environ.get('UTH_DEBUG_TOKEN', '')
+SLOW_REQUEST_THRESHOLD = float(os.environ.get('UTH_SLOW_REQUEST_MS', 5000)) / 1000
+slow_requests = deque(maxlen=int(os.environ.get('UTH_SLOW_REQUEST_BUFFER', 50)))
+_trace_seq = itertools.count()
+
+class StackSampler:
+    """Statistical profiler that periodically samples one thread's stack
+    and counts collapsed stacks ("a;b;c count" folded format)"""
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+    
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+    
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f'{stack} {count}\n')
+
+def has_debug_token():
+    """True if the request carries the configured debug token"""
+    token = request.headers.get('X-Debug-Token', '')
+    # compare_digest only accepts ASCII str, so compare bytes
+    return bool(DEBUG_TOKEN) and hmac.compare_digest(token.encode(), DEBUG_TOKEN.encode())
+
+@contextmanager
+def stage(name):
+    """Record how long a named stage of the current request takes"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages = g.get('stages') if has_app_context() else None
+        if stages is not None:
+            stages.append((name, (time.perf_counter() - start) * 1000))
+
+@app.before_request
+def start_request_profile():
+    if request.method == 'OPTIONS':
+        return
+    g.request_start = time.perf_counter()
+    g.stages = []
+    g.profiled = has_debug_token() or random.random() < PROFILE_SAMPLE_RATE
+    g.sampler = None
+    if g.profiled and PROFILE_TRACE_DIR:
+        g.sampler = StackSampler(threading.get_ident())
+        g.sampler.start()
+
+@app.after_request
+def finish_request_profile(response):
+    # Streamed responses are measured up to the point their headers are sent
+    if 'request_start' not in g:
+        return response
+    total_ms = (time.perf_counter() - g.request_start) * 1000
+    
+    if g.get('profiled'):
+        timings = [f'{name};dur={ms:.1f}' for name, ms in g.stages]
+        timings.append(f'total;dur={total_ms:.1f}')
+        response.headers['Server-Timing'] = ', '.join(timings)
+    
+    if g.get('sampler'):
+        g.sampler.stop()
+        os.makedirs(PROFILE_TRACE_DIR, exist_ok=True)
+        endpoint = (request.endpoint or 'unknown').replace('.', '_')
+        # Sequence number: concurrent requests can share the second, endpoint and pid
+        trace_name = f'{time.strftime("%Y%m%d-%H%M%S")}-{endpoint}-{os.getpid()}-{next(_trace_seq)}.folded'
+        trace_path = os.path.join(PROFILE_TRACE_DIR, trace_name)
+        g.sampler.dump(trace_path)
+        print(f'Profile trace written to {trace_path}')
+    
+    if total_ms >= SLOW_REQUEST_THRESHOLD * 1000:
+        breakdown = ', '.join(f'{name}={ms:.0f}ms' for name, ms in g.get('stages', [])) or 'no stages'
+        print(f'SLOW REQUEST {request.method} {request.path} {total_ms:.0f}ms ({breakdown})')
+        slow_requests.append({
+            'time': datetime.now(timezone.utc).isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'query': request.query_string.decode('utf-8', 'replace'),
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'stages': [{'name': name, 'ms': round(ms, 1)} for name, ms in g.get('stages', [])],
+        })
+    
+    return response
+
+@app.route('/api/admin/slow-requests', methods=['GET'])
+def get_slow_requests():
+    """List recent slow requests, newest first (requires X-Debug-Token)"""
+    if not has_debug_token():
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({
+        'threshold_ms': SLOW_REQUEST_THRESHOLD * 1000,
+        'requests': list(reversed(slow_requests))
+    })
+
+# =============================================================================
+# RESULT CACHE & PREFETCH
+# =============================================================================
+# Resolved lookups are cached until their signed CDN URLs expire. Hit counts
+# are tracked with exponentially decayed counters, and a background thread
+# re-resolves the hottest entries shortly before they go stale, within an
+# hourly upstream budget, so popular videos/posts always hit warm data.
+CACHE_MAX_ENTRIES = int(os.environ.get('UTH_CACHE_MAX_ENTRIES', 256))
+CACHE_DEFAULT_TTL = 3600
+CACHE_MAX_TTL = 4 * 3600
+CACHE_EXPIRY_MARGIN = 300
+
+PREFETCH_ENABLED = os.environ.get('UTH_PREFETCH', '1') != '0'
+PREFETCH_TOP_K = int(os.environ.get('UTH_PREFETCH_TOP_K', 20))
+PREFETCH_BUDGET_PER_HOUR = int(os.environ.get('UTH_PREFETCH_BUDGET_PER_HOUR', 120))
+PREFETCH_MIN_SCORE = 2.0
+PREFETCH_INTERVAL = 30
+PREFETCH_REFRESH_AHEAD = 600
+HOT_KEY_HALF_LIFE = 1800
+HOT_KEY_MAX_TRACKED = 2048
+
+YOUTUBE_EXPIRE_RE = re.compile(r'[?&/]expire[=/](\d+)')
+INSTAGRAM_EXPIRE_RE = re.compile(r'[?&]oe=([0-9A-Fa-f]+)')
+
+# kind -> function(ident) returning (payload, expires_at); filled in below
+RESOLVERS = {}
+
+class ResultCache:
+    """Thread-safe LRU of resolved lookups, each entry with its own expiry"""
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def put(self, key, payload, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def expires_at(self, key):
+        """Expiry of an entry (even if already stale), or None if not cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry else None
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class HotKeyTracker:
+    """Exponentially decayed hit counters: a key's score halves every half_life seconds"""
+    def __init__(self, half_life, max_tracked):
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self._scores = {}
+        self._lock = threading.Lock()
+    
+    def _decayed(self, score, updated, now):
+        return score * 0.5 ** ((now - updated) / self.half_life)
+    
+    def _top(self, k, now):
+        scored = ((key, self._decayed(score, updated, now)) for key, (score, updated) in self._scores.items())
+        return heapq.nlargest(k, scored, key=lambda item: item[1])
+    
+    def hit(self, key):
+        now = time.time()
+        with self._lock:
+            score, updated = self._scores.get(key, (0.0, now))
+            self._scores[key] = (self._decayed(score, updated, now) + 1, now)
+            if len(self._scores) > self.max_tracked:
+                # Forget the coldest half rather than pruning on every hit
+                self._scores = {k: (score, now) for k, score in self._top(self.max_tracked // 2, now)}
+    
+    def top(self, k):
+        """The k hottest keys as (key, score), hottest first"""
+        with self._lock:
+            return self._top(k, time.time())
+    
+    def clear(self):
+        with self._lock:
+            self._scores.clear()
+
+class TokenBucket:
+    """Allows `rate` operations per `per` seconds, bursting up to `rate`"""
+    def __init__(self, rate, per):
+        self.capacity = rate
+        self.fill_rate = rate / per
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def take(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.fill_rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+result_cache = ResultCache(CACHE_MAX_ENTRIES)
+hot_keys = HotKeyTracker(HOT_KEY_HALF_LIFE, HOT_KEY_MAX_TRACKED)
+prefetch_budget = TokenBucket(PREFETCH_BUDGET_PER_HOUR, 3600)
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+def signed_url_expiry(urls, pattern, base=10):
+    """When to treat a result as stale: shortly before its earliest signed URL expires"""
+    now = time.time()
+    expiries = []
+    for url in urls:
+        match = pattern.search(url or '')
+        if match:
+            expiries.append(int(match.group(1), base))
+    expires_at = min(expiries) - CACHE_EXPIRY_MARGIN if expiries else now + CACHE_DEFAULT_TTL
+    return min(expires_at, now + CACHE_MAX_TTL)
+
+def get_or_resolve(kind, ident):
+    """Serve a lookup from the cache, resolving and caching it on a miss.
+    Returns (payload, cache_hit)."""
+    key = (kind, ident)
+    hot_keys.hit(key)
+    payload = result_cache.get(key)
+    if payload is not None:
+        return payload, True
+    payload, expires_at = RESOLVERS[kind](ident)
+    result_cache.put(key, payload, expires_at)
+    return payload, False
+
+def refresh_hot_entries():
+    """Re-resolve popular entries that are about to go stale, within the upstream budget"""
+    now = time.time()
+    refreshed = 0
+    for key, score in hot_keys.top(PREFETCH_TOP_K):
+        if score < PREFETCH_MIN_SCORE:
+            break
+        expires_at = result_cache.expires_at(key)
+        if expires_at is None or expires_at - now > PREFETCH_REFRESH_AHEAD:
+            continue
+        if not prefetch_budget.take():
+            print('Prefetch budget exhausted, skipping remaining hot entries')
+            break
+        kind, ident = key
+        try:
+            payload, new_expiry = RESOLVERS[kind](ident)
+        except Exception as e:
+            print(f'Prefetch of {kind}:{ident} failed: {e}')
+            continue
+        result_cache.put(key, payload, new_expiry)
+        refreshed += 1
+    if refreshed:
+        print(f'Prefetched {refreshed} hot entries')
+    return refreshed
+
+def prefetch_loop():
+    while True:
+        time.sleep(PREFETCH_INTERVAL)
+        try:
+            refresh_hot_entries()
+        except Exception as e:
+            print(f'Prefetcher error: {e}')
+
+def start_prefetcher():
+    """Start the background refresher (safe to call again, e.g. after fork)"""
+    global _prefetcher
+    if not PREFETCH_ENABLED or (_prefetcher is not None and _prefetcher.is_alive()):
+        return
+    # Every request thread calls this; only one may start the thread
+    with _prefetcher_lock:
+        if _prefetcher is not None and _prefetcher.is_alive():
+            return
+        _prefetcher = threading.Thread(target=prefetch_loop, name='prefetcher', daemon=True)
+        _prefetcher.start()
+
 
 # =============================================================================
 # INSTAGRAM DOWNLOADER
@@ -51,14 +383,36 @@ def fetch_post_with_retry(shortcode, max_retries=2):
                 time.sleep(1)
     raise last_error
 
+# Compiled once at import (and shared by forked workers)
+INSTAGRAM_POST_RE = re.compile(r'/(p|reel)/([A-Za-z0-9_-]+)')
+SHORTCODE_RE = re.compile(r'[A-Za-z0-9_-]+')
+FILE_EXT_RE = re.compile(r'[a-z0-9]{1,5}')
+UNSAFE_FILENAME_RE = re.compile(r'[^A-Za-z0-9._-]')
+
+MEDIA_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Referer': 'https://www.instagram.com/',
+}
+
+MEDIA_FETCH_WORKERS = 4
+
+def new_media_session():
+    """Shared session so CDN fetches reuse pooled keep-alive connections"""
+    session = requests.Session()
+    session.mount('https://', requests.adapters.HTTPAdapter(
+        pool_connections=4, pool_maxsize=MEDIA_FETCH_WORKERS * 2))
+    return session
+
+media_session = new_media_session()
+
+STREAM_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+MAX_BUNDLE_ITEMS = 20
+
 def fetch_image_as_base64(url):
     """Fetch an image and convert to base64 data URL"""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Referer': 'https://www.instagram.com/',
-        }
-        response = requests.get(url, headers=headers, timeout=10)
+        response = media_session.get(url, headers=MEDIA_HEADERS, timeout=10)
         if response.status_code == 200:
             content_type = response.headers.get('Content-Type', 'image/jpeg')
             base64_data = base64.b64encode(response.content).decode('utf-8')
@@ -67,6 +421,113 @@ def fetch_image_as_base64(url):
         print(f'Failed to fetch image as base64: {e}')
     return None
 
+def build_media_item(media_type, url, display_url, with_thumbnail=True):
+    """Build one media entry, inlining the thumbnail as base64 to avoid CORS"""
+    thumbnail_base64 = fetch_image_as_base64(display_url) if with_thumbnail else None
+    return {
+        'type': media_type,
+        'url_high': url,
+        'url_low': url,
+        'thumbnail': thumbnail_base64 or display_url
+    }
+
+def collect_post_media(post, with_thumbnails=True):
+    """List every image/video in a post (all items for carousels)"""
+    media = []
+    
+    # Check if it's a sidecar (carousel/album)
+    if post.typename == 'GraphSidecar':
+        print(f'Found carousel with {post.mediacount} items')
+        
+        # Get all items in the carousel
+        for i, node in enumerate(post.get_sidecar_nodes()):
+            display_url = node.display_url
+            
+            if node.is_video:
+                video_url = node.video_url
+                print(f'  [{i+1}] Video: {video_url[:80]}...')
+                media.append(build_media_item('video', video_url, display_url, with_thumbnails))
+            else:
+                print(f'  [{i+1}] Image: {display_url[:80]}...')
+                media.append(build_media_item('image', display_url, display_url, with_thumbnails))
+    
+    # Single image post
+    elif post.typename == 'GraphImage':
+        img_url = post.url
+        print(f'Single image: {img_url[:80]}...')
+        media.append(build_media_item('image', img_url, img_url, with_thumbnails))
+    
+    # Single video post
+    elif post.typename == 'GraphVideo':
+        video_url = post.video_url
+        print(f'Single video: {video_url[:80]}...')
+        media.append(build_media_item('video', video_url, post.url, with_thumbnails))
+    
+    return media
+
+def resolve_instagram(shortcode):
+    """Fetch a post's media list; returns (media, expires_at)"""
+    # Fetch post with retry logic
+    with stage('fetch_post'):
+        post = fetch_post_with_retry(shortcode)
+    # URLs only: thumbnails are inlined per response, so cached entries stay small
+    with stage('collect_media'):
+        media = collect_post_media(post, with_thumbnails=False)
+    if not media:
+        raise Exception('No media found in this post')
+    expires_at = signed_url_expiry([item['url_high'] for item in media], INSTAGRAM_EXPIRE_RE, base=16)
+    return media, expires_at
+
+RESOLVERS['instagram'] = resolve_instagram
+
+# ── Progressive (NDJSON) responses ─────────────────────────────────
+def ndjson_line(obj):
+    return json.dumps(obj, separators=(',', ':')) + '\n'
+
+def inline_thumbnail(item):
+    """Copy of an item with its thumbnail inlined as base64; the item itself keeps the URL"""
+    if item['thumbnail'].startswith('data:'):
+        return item
+    return {**item, 'thumbnail': fetch_image_as_base64(item['thumbnail']) or item['thumbnail']}
+
+def stream_media_items(shortcode, media, on_complete=None):
+    """Yield a meta line with the item count, then each item as soon as its
+    thumbnail is inlined, then a done line. Items can finish out of order,
+    so each line carries its index; nothing is buffered once it is written."""
+    yield ndjson_line({'type': 'meta', 'shortcode': shortcode, 'count': len(media)})
+    pool = ThreadPoolExecutor(max_workers=MEDIA_FETCH_WORKERS)
+    futures = {pool.submit(inline_thumbnail, item): i for i, item in enumerate(media)}
+    try:
+        for future in as_completed(futures):
+            # Drop our reference so the image bytes go once the line is written
+            yield ndjson_line({'type': 'item', 'index': futures.pop(future), 'media': future.result()})
+        yield ndjson_line({'type': 'done', 'count': len(media)})
+        if on_complete:
+            on_complete(media)
+    finally:
+        # Client may have disconnected: don't fetch thumbnails nobody will read
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def stream_instagram(shortcode):
+    """NDJSON variant of /api/instagram: metadata first, items as they resolve"""
+    key = ('instagram', shortcode)
+    hot_keys.hit(key)
+    media = result_cache.get(key)
+    cache_hit = media is not None
+    on_complete = None
+    
+    if not cache_hit:
+        # URLs only; thumbnails are fetched while the response streams
+        media, expires_at = resolve_instagram(shortcode)
+        # Only cache posts that streamed to completion
+        on_complete = lambda items: result_cache.put(key, items, expires_at)
+    
+    print(f'Streaming {len(media)} media items{" (cached)" if cache_hit else ""}')
+    return Response(stream_media_items(shortcode, media, on_complete), mimetype='application/x-ndjson', headers={
+        'X-Cache': 'HIT' if cache_hit else 'MISS',
+        'X-Accel-Buffering': 'no',
+    })
+
 @app.route('/api/instagram', methods=['GET', 'OPTIONS'])
 def get_instagram():
     # Handle preflight OPTIONS request
@@ -80,91 +541,410 @@ def get_instagram():
     
     try:
         # Extract shortcode from URL
-        match = re.search(r'/(p|reel)/([A-Za-z0-9_-]+)', url)
+        match = INSTAGRAM_POST_RE.search(url)
         if not match:
             return jsonify({'error': 'Invalid Instagram URL'}), 400
         
         shortcode = match.group(2)
         print(f'\n=== Fetching Instagram post: {shortcode} ===')
         
-        # Fetch post with retry logic
-        post = fetch_post_with_retry(shortcode)
-        
-        media = []
+        if request.args.get('stream') == '1':
+            return stream_instagram(shortcode)
         
-        # Check if it's a sidecar (carousel/album)
-        if post.typename == 'GraphSidecar':
-            print(f'Found carousel with {post.mediacount} items')
-            
-            # Get all items in the carousel
-            for i, node in enumerate(post.get_sidecar_nodes()):
-                display_url = node.display_url
-                
-                # Fetch image as base64 to avoid CORS
-                thumbnail_base64 = fetch_image_as_base64(display_url)
-                
-                if node.is_video:
-                    video_url = node.video_url
-                    print(f'  [{i+1}] Video: {video_url[:80]}...')
-                    media.append({
-                        'type': 'video',
-                        'url_high': video_url,
-                        'url_low': video_url,
-                        'thumbnail': thumbnail_base64 or display_url
-                    })
-                else:
-                    print(f'  [{i+1}] Image: {display_url[:80]}...')
-                    media.append({
-                        'type': 'image',
-                        'url_high': display_url,
-                        'url_low': display_url,
-                        'thumbnail': thumbnail_base64 or display_url
-                    })
+        media, cache_hit = get_or_resolve('instagram', shortcode)
+        with stage('inline_thumbnails'), ThreadPoolExecutor(max_workers=MEDIA_FETCH_WORKERS) as pool:
+            media = list(pool.map(inline_thumbnail, media))
         
-        # Single image post
-        elif post.typename == 'GraphImage':
-            img_url = post.url
-            print(f'Single image: {img_url[:80]}...')
-            
-            thumbnail_base64 = fetch_image_as_base64(img_url)
-            
-            media.append({
-                'type': 'image',
-                'url_high': img_url,
-                'url_low': img_url,
-                'thumbnail': thumbnail_base64 or img_url
-            })
-        
-        # Single video post
-        elif post.typename == 'GraphVideo':
-            video_url = post.video_url
-            print(f'Single video: {video_url[:80]}...')
-            
-            thumbnail_base64 = fetch_image_as_base64(post.url)
-            
-            media.append({
-                'type': 'video',
-                'url_high': video_url,
-                'url_low': video_url,
-                'thumbnail': thumbnail_base64 or post.url
-            })
-        
-        print(f'Successfully fetched {len(media)} media items')
+        print(f'Successfully fetched {len(media)} media items{" (cached)" if cache_hit else ""}')
         
         return jsonify({
             'success': True,
             'media': media
-        })
+        }), 200, {'X-Cache': 'HIT' if cache_hit else 'MISS'}
         
     except Exception as e:
         print(f'Error: {str(e)}')
         return jsonify({'error': f'Failed to fetch Instagram post: {str(e)}'}), 500
 
 
+# ── Carousel ZIP bundle ────────────────────────────────────────────
+class ZipStream:
+    """Write-only sink for zipfile that hands written bytes back to a generator"""
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+def spool_media(url):
+    """Download a media URL into a spooled temp file; returns (file, size)"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    try:
+        with media_session.get(url, headers=MEDIA_HEADERS, timeout=15, stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                spooled.write(chunk)
+        size = spooled.tell()
+        spooled.seek(0)
+        return spooled, size
+    except Exception:
+        spooled.close()
+        raise
+
+def discard_spool(future):
+    """Close a finished fetch's spooled file once nobody is going to write it"""
+    if not future.cancelled() and future.exception() is None:
+        future.result()[0].close()
+
+def stream_media_zip(entries):
+    """Yield a stored (uncompressed) ZIP of (name, url) entries.
+    At most MEDIA_FETCH_WORKERS items are fetched ahead of the writer, and the
+    next fetch only starts once a finished item has been written, so a slow
+    client throttles the fetching instead of the archive piling up in memory."""
+    sink = ZipStream()
+    pool = ThreadPoolExecutor(max_workers=MEDIA_FETCH_WORKERS)
+    remaining = iter(entries)
+    in_flight = {}
+    
+    def fetch_next():
+        for name, url in remaining:
+            in_flight[pool.submit(spool_media, url)] = name
+            return
+    
+    for _ in range(MEDIA_FETCH_WORKERS):
+        fetch_next()
+    try:
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as zf:
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = in_flight.pop(future)
+                    try:
+                        spooled, size = future.result()
+                    except Exception as e:
+                        print(f'  Skipping {name}: {e}')
+                        fetch_next()
+                        continue
+                    with spooled:
+                        zinfo = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                        zinfo.compress_type = zipfile.ZIP_STORED
+                        zinfo.file_size = size
+                        with zf.open(zinfo, 'w') as dest:
+                            while chunk := spooled.read(STREAM_CHUNK_SIZE):
+                                dest.write(chunk)
+                                yield from sink.drain()
+                    yield from sink.drain()
+                    print(f'  Added {name} ({size:,} bytes)')
+                    fetch_next()
+        yield from sink.drain()
+    finally:
+        # Client may have disconnected: stop queued fetches and drop their spools,
+        # including those of fetches still running
+        pool.shutdown(wait=False, cancel_futures=True)
+        for future in in_flight:
+            future.add_done_callback(discard_spool)
+
+@app.route('/api/instagram/bundle', methods=['GET', 'OPTIONS'])
+def bundle_instagram():
+    """Stream selected carousel items as a single ZIP download"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    shortcode = request.args.get('shortcode')
+    if not shortcode:
+        match = INSTAGRAM_POST_RE.search(request.args.get('url', ''))
+        shortcode = match.group(2) if match else None
+    if not shortcode or not SHORTCODE_RE.fullmatch(shortcode):
+        return jsonify({'error': 'shortcode or url parameter required'}), 400
+    
+    try:
+        indices = [int(i) for i in request.args.get('indices', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify({'error': 'indices must be a comma-separated list of numbers'}), 400
+    video_ext = request.args.get('video_ext', 'mp4')
+    if not FILE_EXT_RE.fullmatch(video_ext):
+        video_ext = 'mp4'
+    
+    try:
+        print(f'\n=== Bundling Instagram post: {shortcode} ===')
+        # Same cached lookup as /api/instagram (it raises if the post has no media)
+        media, cache_hit = get_or_resolve('instagram', shortcode)
+    except Exception as e:
+        print(f'Error: {str(e)}')
+        return jsonify({'error': f'Failed to fetch Instagram post: {str(e)}'}), 500
+    
+    if not indices:
+        indices = list(range(len(media)))
+    indices = sorted(set(indices))[:MAX_BUNDLE_ITEMS]
+    if any(i < 0 or i >= len(media) for i in indices):
+        return jsonify({'error': f'indices must be between 0 and {len(media) - 1}'}), 400
+    
+    entries = []
+    for i in indices:
+        item = media[i]
+        ext = video_ext if item['type'] == 'video' else 'jpg'
+        entries.append((f'instagram_{i + 1}.{ext}', item['url_high']))
+    
+    return Response(
+        stream_media_zip(entries),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename="instagram_{shortcode}.zip"',
+            'X-Cache': 'HIT' if cache_hit else 'MISS',
+        }
+    )
+
+
+# ── Media proxy ────────────────────────────────────────────────────
+PROXY_ALLOWED_HOSTS = ('cdninstagram.com', 'fbcdn.net')
+PROXY_PASSTHROUGH_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges', 'Last-Modified', 'ETag')
+
+def is_proxyable_media_url(url):
+    """Only proxy https URLs on Instagram's CDNs so this can't be used as an open proxy"""
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    return parsed.scheme == 'https' and any(host == h or host.endswith('.' + h) for h in PROXY_ALLOWED_HOSTS)
+
+MAX_PROXY_REDIRECTS = 3
+
+def fetch_proxied_media(url, headers):
+    """GET a CDN URL, following redirects only while they stay on allowed hosts.
+    Returns the upstream response, or None if a redirect leaves the CDN."""
+    for _ in range(MAX_PROXY_REDIRECTS + 1):
+        upstream = media_session.get(url, headers=headers, timeout=15, stream=True, allow_redirects=False)
+        if not upstream.is_redirect:
+            return upstream
+        upstream.close()
+        url = urljoin(url, upstream.headers['Location'])
+        if not is_proxyable_media_url(url):
+            return None
+    raise requests.TooManyRedirects(f'More than {MAX_PROXY_REDIRECTS} redirects')
+
+@app.route('/api/instagram/media', methods=['GET', 'OPTIONS'])
+def proxy_instagram_media():
+    """Stream a CDN image/video through our server, forwarding Range requests"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    url = request.args.get('url')
+    if not url:
+        return jsonify({'error': 'URL parameter required'}), 400
+    if not is_proxyable_media_url(url):
+        return jsonify({'error': 'Only Instagram CDN URLs can be proxied'}), 400
+    
+    # Ask for the raw bytes so Content-Length/Content-Range still match what we send
+    upstream_headers = {**MEDIA_HEADERS, 'Accept-Encoding': 'identity'}
+    for name in ('Range', 'If-Range'):
+        if name in request.headers:
+            upstream_headers[name] = request.headers[name]
+    
+    try:
+        upstream = fetch_proxied_media(url, upstream_headers)
+    except requests.RequestException as e:
+        print(f'Media proxy error: {e}')
+        return jsonify({'error': 'Failed to reach Instagram CDN'}), 502
+    if upstream is None:
+        return jsonify({'error': 'Instagram CDN redirected outside its domains'}), 502
+    
+    if upstream.status_code not in (200, 206, 416):
+        upstream.close()
+        return jsonify({'error': f'Instagram CDN returned {upstream.status_code}'}), 502
+    
+    headers = {name: upstream.headers[name] for name in PROXY_PASSTHROUGH_HEADERS if name in upstream.headers}
+    filename = request.args.get('filename')
+    if filename:
+        safe_name = UNSAFE_FILENAME_RE.sub('_', filename)
+        headers['Content-Disposition'] = f'attachment; filename="{safe_name}"'
+    
+    def generate():
+        try:
+            for chunk in upstream.iter_content(STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            upstream.close()
+    
+    return Response(generate(), status=upstream.status_code, headers=headers)
+
+
 # =============================================================================
 # YOUTUBE DOWNLOADER
 # =============================================================================
 
+YOUTUBE_ID_RE = re.compile(r'(?:v=|/)([a-zA-Z0-9_-]{11})')
+
+# Rough bitrates used when yt-dlp doesn't report a filesize
+BITRATE_ESTIMATES_KBPS = {
+    144: 200, 240: 400, 360: 800,
+    480: 1500, 720: 2500, 1080: 4500
+}
+
+def estimate_filesize(fmt, duration):
+    """Return (size_in_bytes, is_estimate) for a format, or (None, True) if unknown"""
+    filesize = fmt.get('filesize') or fmt.get('filesize_approx')
+    if filesize and filesize > 0:
+        return filesize, False
+    height = fmt.get('height')
+    if duration and height:
+        bitrate_kbps = BITRATE_ESTIMATES_KBPS.get(height, 1000)
+        return int(bitrate_kbps * duration / 8 * 1024), True
+    return None, True
+
+# ── Pooled YoutubeDL instances ─────────────────────────────────────
+# Building a YoutubeDL parses options and loads extractors before any network
+# I/O, so info lookups check out pre-built instances instead. Instances are
+# reset between uses and recycled after YDL_MAX_USES requests or any error.
+# One per request thread (gunicorn.conf.py's UTH_THREADS), so checkouts don't queue
+YDL_POOL_SIZE = int(os.environ.get('UTH_YDL_POOL_SIZE', os.environ.get('UTH_THREADS', 8)))
+YDL_MAX_USES = int(os.environ.get('UTH_YDL_MAX_USES', 100))
+
+# yt-dlp options - use defaults for best format discovery
+YDL_INFO_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': False,
+    'socket_timeout': 30,
+}
+
+# Per-call counters YoutubeDL keeps on the instance
+YDL_RESET_STATE = {'_download_retcode': 0, '_num_downloads': 0, '_num_videos': 0, '_playlist_level': 0}
+
+# LIFO so the most recently used (warmest) instances are handed out first
+_ydl_pool = queue.LifoQueue(maxsize=YDL_POOL_SIZE)
+
+def new_ydl():
+    """Build an info-extraction YoutubeDL and pay its one-off setup costs up front"""
+    ydl = yt_dlp.YoutubeDL(dict(YDL_INFO_OPTS))
+    ydl.get_info_extractor('Youtube')
+    ydl.cookiejar  # created lazily on first access
+    return ydl
+
+def reset_ydl(ydl):
+    """Clear per-call state so the next request starts clean"""
+    for name, value in YDL_RESET_STATE.items():
+        if hasattr(ydl, name):
+            setattr(ydl, name, value)
+    for name in ('_playlist_urls', '_printed_messages'):
+        getattr(ydl, name, set()).clear()
+
+def warm_ydl_pool():
+    """Fill the pool with ready-to-use instances. Called per worker (init_worker),
+    never at import, so a pre-fork master doesn't build instances it can't share.
+    Elsewhere the pool fills as instances are returned to it."""
+    while not _ydl_pool.full():
+        try:
+            _ydl_pool.put_nowait([new_ydl(), 0])
+        except queue.Full:
+            break
+
+def clear_ydl_pool():
+    """Close and drop every pooled instance"""
+    while True:
+        try:
+            ydl, _ = _ydl_pool.get_nowait()
+        except queue.Empty:
+            break
+        ydl.close()
+
+@contextmanager
+def pooled_ydl():
+    """Check out a warm YoutubeDL, falling back to a fresh one if the pool is busy"""
+    try:
+        # Never wait: building a fresh instance (~80 ms) beats queueing for one
+        entry = _ydl_pool.get_nowait()
+    except queue.Empty:
+        entry = [new_ydl(), 0]
+    ydl = entry[0]
+    healthy = False
+    try:
+        yield ydl
+        healthy = True
+    finally:
+        entry[1] += 1
+        if healthy and entry[1] < YDL_MAX_USES:
+            reset_ydl(ydl)
+            try:
+                _ydl_pool.put_nowait(entry)
+            except queue.Full:
+                ydl.close()
+        else:
+            ydl.close()
+
+
+def resolve_youtube(url):
+    """Extract a video's info and format table; returns (video_data, expires_at)"""
+    with pooled_ydl() as ydl:
+        with stage('extract_info'):
+            info = ydl.extract_info(url, download=False)
+    
+    # Get video information
+    video_data = {
+        'success': True,
+        'title': info.get('title', 'Unknown'),
+        'channel': info.get('uploader', 'Unknown'),
+        'duration': info.get('duration', 0),
+        'views': info.get('view_count', 0),
+        'thumbnail': info.get('thumbnail', ''),
+        'formats': []
+    }
+    
+    # Filter and sort formats
+    formats = info.get('formats', [])
+    
+    # Collect all video formats with different qualities
+    quality_map = {}
+    
+    for fmt in formats:
+        # Skip audio-only formats
+        if fmt.get('vcodec') == 'none':
+            continue
+    
+        height = fmt.get('height')
+        if not height:
+            continue
+    
+        quality_label = f"{height}p"
+    
+        # Prefer formats with audio, but include video-only if that's all we have
+        has_audio = fmt.get('acodec') != 'none'
+    
+        # Only replace if we don't have this quality yet, or if this one has audio and the stored one doesn't
+        if quality_label not in quality_map or (has_audio and not quality_map[quality_label].get('has_audio', False)):
+            # Fall back to a duration * bitrate estimate when yt-dlp has no size
+            filesize, is_estimate = estimate_filesize(fmt, info.get('duration', 0))
+            if filesize and not is_estimate:
+                filesize_str = f"{filesize / (1024*1024):.1f} MB"
+            elif filesize:
+                filesize_str = f"~{filesize / (1024*1024):.1f} MB"
+            else:
+                filesize_str = "Size unknown"
+    
+            quality_map[quality_label] = {
+                'quality': quality_label,
+                'ext': fmt.get('ext', 'mp4'),
+                'url': fmt.get('url', ''),
+                'filesize': filesize_str,
+                'format_id': fmt.get('format_id', ''),
+                'has_audio': has_audio,
+                'height': height
+            }
+    
+    # Convert to list and sort by height
+    video_data['formats'] = sorted(quality_map.values(), key=lambda x: x['height'], reverse=True)
+    
+    expires_at = signed_url_expiry([f['url'] for f in video_data['formats']], YOUTUBE_EXPIRE_RE)
+    return video_data, expires_at
+
+RESOLVERS['youtube'] = lambda video_id: resolve_youtube(f'https://www.youtube.com/watch?v={video_id}')
+
+
 @app.route('/api/youtube', methods=['GET', 'OPTIONS'])
 def get_youtube():
     # Handle preflight OPTIONS request
@@ -178,88 +958,20 @@ def get_youtube():
     
     # Clean the URL - remove playlist parameters to get just the video
     # Extract video ID and reconstruct clean URL
-    video_id_match = re.search(r'(?:v=|/)([a-zA-Z0-9_-]{11})', url)
+    video_id_match = YOUTUBE_ID_RE.search(url)
     if video_id_match:
         video_id = video_id_match.group(1)
         url = f'https://www.youtube.com/watch?v={video_id}'
         print(f"Cleaned URL to: {url}")
     
     try:
-        # yt-dlp options - use defaults for best format discovery
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'socket_timeout': 30,
-        }
+        if video_id_match:
+            video_data, cache_hit = get_or_resolve('youtube', video_id)
+        else:
+            video_data, _ = resolve_youtube(url)
+            cache_hit = False
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            
-            # Get video information
-            video_data = {
-                'success': True,
-                'title': info.get('title', 'Unknown'),
-                'channel': info.get('uploader', 'Unknown'),
-                'duration': info.get('duration', 0),
-                'views': info.get('view_count', 0),
-                'thumbnail': info.get('thumbnail', ''),
-                'formats': []
-            }
-            
-            # Filter and sort formats
-            formats = info.get('formats', [])
-            
-            # Collect all video formats with different qualities
-            quality_map = {}
-            
-            for fmt in formats:
-                # Skip audio-only formats
-                if fmt.get('vcodec') == 'none':
-                    continue
-                
-                height = fmt.get('height')
-                if not height:
-                    continue
-                
-                quality_label = f"{height}p"
-                
-                # Prefer formats with audio, but include video-only if that's all we have
-                has_audio = fmt.get('acodec') != 'none'
-                
-                # Only replace if we don't have this quality yet, or if this one has audio and the stored one doesn't
-                if quality_label not in quality_map or (has_audio and not quality_map[quality_label].get('has_audio', False)):
-                    filesize = fmt.get('filesize') or fmt.get('filesize_approx')
-                    if filesize and filesize > 0:
-                        filesize_str = f"{filesize / (1024*1024):.1f} MB"
-                    else:
-                        # Estimate based on duration and quality if available
-                        duration = info.get('duration', 0)
-                        if duration and height:
-                            # Rough estimate: bitrate varies by quality
-                            bitrate_kbps = {
-                                144: 200, 240: 400, 360: 800, 
-                                480: 1500, 720: 2500, 1080: 4500
-                            }.get(height, 1000)
-                            estimated_size = (bitrate_kbps * duration / 8) / 1024  # MB
-                            filesize_str = f"~{estimated_size:.1f} MB"
-                        else:
-                            filesize_str = "Size unknown"
-                    
-                    quality_map[quality_label] = {
-                        'quality': quality_label,
-                        'ext': fmt.get('ext', 'mp4'),
-                        'url': fmt.get('url', ''),
-                        'filesize': filesize_str,
-                        'format_id': fmt.get('format_id', ''),
-                        'has_audio': has_audio,
-                        'height': height
-                    }
-            
-            # Convert to list and sort by height
-            video_data['formats'] = sorted(quality_map.values(), key=lambda x: x['height'], reverse=True)
-            
-            return jsonify(video_data)
+        return jsonify(video_data), 200, {'X-Cache': 'HIT' if cache_hit else 'MISS'}
         
     except Exception as e:
         error_msg = f'{type(e).__name__}: {str(e)}'
@@ -272,23 +984,361 @@ def get_youtube():
         }), 500
 
 
+# ── DASH manifest preview ──────────────────────────────────────────
+# extract_info already lists every separate video/audio stream. Wrapping
+# them in an MPD lets a browser player (dash.js, Shaka) preview any quality
+# straight from the CDN with adaptive switching; we only serve the manifest.
+MPD_PROFILE = 'urn:mpeg:dash:profile:isoff-on-demand:2011'
+MPD_AUDIO_CHANNELS_SCHEME = 'urn:mpeg:dash:23003:3:audio_channel_configuration:2011'
+MP4_PROBE_BYTES = 16 * 1024
+MANIFEST_MAX_HEIGHT = 2160
+
+def find_mp4_index_range(fmt):
+    """Locate a single-file fragmented MP4's init segment and sidx box.
+    yt-dlp doesn't keep YouTube's initRange/indexRange, so read the top-level
+    box headers from the first few KB. Returns (init_end, index_start, index_end)."""
+    headers = {**(fmt.get('http_headers') or {}), 'Range': f'bytes=0-{MP4_PROBE_BYTES - 1}'}
+    data = b''
+    with media_session.get(fmt['url'], headers=headers, timeout=10, stream=True) as response:
+        if response.status_code not in (200, 206):
+            return None
+        for chunk in response.iter_content(MP4_PROBE_BYTES):
+            data += chunk
+            if len(data) >= MP4_PROBE_BYTES:
+                break
+    
+    offset = 0
+    while offset + 8 <= len(data):
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        if size == 1 and offset + 16 <= len(data):
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+        if box_type == b'sidx':
+            return offset - 1, offset, offset + size - 1
+        if size < 8:
+            break
+        offset += size
+    return None
+
+def manifest_stream(fmt, ranges, duration):
+    """Keep just what an MPD Representation needs from a yt-dlp format"""
+    init_end, index_start, index_end = ranges
+    bandwidth = (fmt.get('tbr') or 0) * 1000
+    if not bandwidth and fmt.get('filesize') and duration:
+        bandwidth = fmt['filesize'] * 8 / duration
+    return {
+        'id': fmt['format_id'],
+        'url': fmt['url'],
+        'codecs': fmt.get('vcodec') if fmt.get('vcodec') != 'none' else fmt.get('acodec'),
+        'bandwidth': int(bandwidth) or 1,
+        'width': fmt.get('width'),
+        'height': fmt.get('height'),
+        'fps': fmt.get('fps'),
+        'asr': fmt.get('asr'),
+        'channels': fmt.get('audio_channels'),
+        'language': fmt.get('language'),
+        'init_range': f'0-{init_end}',
+        'index_range': f'{index_start}-{index_end}',
+    }
+
+def resolve_youtube_manifest(video_id):
+    """Extract a video's MP4 DASH streams and their index ranges;
+    returns ({'duration', 'video', 'audio'}, expires_at)"""
+    with pooled_ydl() as ydl:
+        with stage('extract_info'):
+            info = ydl.extract_info(f'https://www.youtube.com/watch?v={video_id}', download=False)
+    
+    duration = info.get('duration') or 0
+    candidates = []
+    for fmt in info.get('formats', []):
+        # Only fragmented MP4 (avc1/av01 video, mp4a audio) can be indexed here;
+        # skip DRM, throttled-client and DRC (dynamic range compressed) variants
+        if fmt.get('container') not in ('mp4_dash', 'm4a_dash') or fmt.get('protocol') != 'https':
+            continue
+        if fmt.get('has_drm') or not fmt.get('url') or fmt['format_id'].endswith('-drc'):
+            continue
+        if fmt.get('vcodec') != 'none' and (fmt.get('height') or 0) > MANIFEST_MAX_HEIGHT:
+            continue
+        candidates.append(fmt)
+    
+    streams = {'duration': duration, 'video': [], 'audio': []}
+    with stage('probe_index'):
+        with ThreadPoolExecutor(max_workers=MEDIA_FETCH_WORKERS) as pool:
+            probes = {pool.submit(find_mp4_index_range, fmt): fmt for fmt in candidates}
+            for future in as_completed(probes):
+                fmt = probes[future]
+                try:
+                    ranges = future.result()
+                except Exception as e:
+                    print(f'  Skipping format {fmt["format_id"]}: {e}')
+                    continue
+                if ranges:
+                    kind = 'audio' if fmt.get('vcodec') == 'none' else 'video'
+                    streams[kind].append(manifest_stream(fmt, ranges, duration))
+    
+    if not streams['video'] or not streams['audio']:
+        raise Exception('No DASH streams available for this video')
+    expires_at = signed_url_expiry([s['url'] for s in streams['video'] + streams['audio']], YOUTUBE_EXPIRE_RE)
+    return streams, expires_at
+
+RESOLVERS['youtube_manifest'] = resolve_youtube_manifest
+
+def add_representation(adaptation_set, stream, attrs):
+    return ET.SubElement(adaptation_set, 'Representation', {
+        'id': stream['id'], 'codecs': stream['codecs'], 'bandwidth': str(stream['bandwidth']), **attrs})
+
+def add_segment_base(rep, stream):
+    ET.SubElement(rep, 'BaseURL').text = stream['url']
+    segment_base = ET.SubElement(rep, 'SegmentBase', {'indexRange': stream['index_range']})
+    ET.SubElement(segment_base, 'Initialization', {'range': stream['init_range']})
+
+def build_mpd(streams, max_height):
+    """Render an on-demand profile MPD: one video AdaptationSet per codec
+    family (players can't switch codecs mid-stream), one audio set per language"""
+    mpd = ET.Element('MPD', {
+        'xmlns': 'urn:mpeg:dash:schema:mpd:2011',
+        'type': 'static',
+        'profiles': MPD_PROFILE,
+        'minBufferTime': 'PT1.5S',
+        'mediaPresentationDuration': f"PT{streams['duration']}S",
+    })
+    period = ET.SubElement(mpd, 'Period', {'id': '0', 'start': 'PT0S'})
+    
+    video_sets, audio_sets = {}, {}
+    for stream in streams['video']:
+        if (stream['height'] or 0) <= max_height:
+            video_sets.setdefault(stream['codecs'].split('.')[0], []).append(stream)
+    for stream in streams['audio']:
+        audio_sets.setdefault(stream['language'] or 'und', []).append(stream)
+    
+    set_id = 0
+    for family, group in video_sets.items():
+        adaptation_set = ET.SubElement(period, 'AdaptationSet', {
+            'id': str(set_id), 'contentType': 'video', 'mimeType': 'video/mp4',
+            'subsegmentAlignment': 'true', 'subsegmentStartsWithSAP': '1'})
+        set_id += 1
+        for stream in sorted(group, key=lambda s: s['bandwidth']):
+            attrs = {'width': str(stream['width'] or 0), 'height': str(stream['height'] or 0)}
+            if stream['fps']:
+                attrs['frameRate'] = str(stream['fps'])
+            add_segment_base(add_representation(adaptation_set, stream, attrs), stream)
+    
+    for language, group in audio_sets.items():
+        adaptation_set = ET.SubElement(period, 'AdaptationSet', {
+            'id': str(set_id), 'contentType': 'audio', 'mimeType': 'audio/mp4', 'lang': language,
+            'subsegmentAlignment': 'true', 'subsegmentStartsWithSAP': '1'})
+        set_id += 1
+        for stream in sorted(group, key=lambda s: s['bandwidth']):
+            attrs = {'audioSamplingRate': str(stream['asr'])} if stream['asr'] else {}
+            rep = add_representation(adaptation_set, stream, attrs)
+            if stream['channels']:
+                ET.SubElement(rep, 'AudioChannelConfiguration', {
+                    'schemeIdUri': MPD_AUDIO_CHANNELS_SCHEME, 'value': str(stream['channels'])})
+            add_segment_base(rep, stream)
+    
+    return ET.tostring(mpd, encoding='utf-8', xml_declaration=True)
+
+@app.route('/api/youtube/manifest', methods=['GET', 'OPTIONS'])
+def youtube_manifest():
+    """DASH manifest of a video's streams, for previewing straight from the CDN"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    video_id_match = YOUTUBE_ID_RE.search(request.args.get('url', ''))
+    if not video_id_match:
+        return jsonify({'error': 'YouTube URL parameter required'}), 400
+    try:
+        max_height = int(request.args.get('max_height', 1080))
+    except ValueError:
+        return jsonify({'error': 'max_height must be a number'}), 400
+    
+    try:
+        streams, cache_hit = get_or_resolve('youtube_manifest', video_id_match.group(1))
+    except Exception as e:
+        print(f'Manifest error: {type(e).__name__}: {str(e)}')
+        return jsonify({'error': f'Failed to build manifest: {str(e)}'}), 500
+    
+    if not any((stream['height'] or 0) <= max_height for stream in streams['video']):
+        return jsonify({'error': f'No video streams at or below {max_height}p'}), 404
+    mpd = build_mpd(streams, max_height)
+    return Response(mpd, mimetype='application/dash+xml', headers={'X-Cache': 'HIT' if cache_hit else 'MISS'})
+
+
+# ── Download admission control ─────────────────────────────────────
+# Every download needs scratch space for yt-dlp to write and merge into.
+# Limit how many run at once and how many bytes they may reserve so a burst
+# of large requests can't fill /tmp (512 MB on Vercel) and kill every job.
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get('UTH_MAX_CONCURRENT_DOWNLOADS', 2))
+# Running and queued downloads each hold a request thread, so cap the queue to
+# keep a few of the worker's UTH_THREADS free for lookups and the media proxy
+REQUEST_THREADS = int(os.environ.get('UTH_THREADS', 8))
+FREE_REQUEST_THREADS = 2
+MAX_QUEUED_DOWNLOADS = max(0, min(int(os.environ.get('UTH_MAX_QUEUED_DOWNLOADS', 8)),
+                                  REQUEST_THREADS - MAX_CONCURRENT_DOWNLOADS - FREE_REQUEST_THREADS))
+DOWNLOAD_QUEUE_TIMEOUT = float(os.environ.get('UTH_DOWNLOAD_QUEUE_TIMEOUT', 30))
+# For the whole host; a pre-forking server gives each worker a share (share_download_budget)
+TOTAL_DOWNLOAD_DISK_BUDGET = int(os.environ.get('UTH_DOWNLOAD_DISK_BUDGET_MB', 2048)) * 1024 * 1024
+DOWNLOAD_DISK_BUDGET = TOTAL_DOWNLOAD_DISK_BUDGET
+DEFAULT_DOWNLOAD_ESTIMATE = 100 * 1024 * 1024
+SCRATCH_PREFIX = 'uth-dl-'
+SCRATCH_MAX_AGE = int(os.environ.get('UTH_SCRATCH_MAX_AGE', 3600))
+
+_admission = threading.Condition()
+_active_downloads = 0
+_queued_downloads = 0
+_reserved_bytes = 0
+
+class DownloadRejected(Exception):
+    """Raised when a download can't be admitted; carries the HTTP status to return"""
+    def __init__(self, message, status=503):
+        super().__init__(message)
+        self.status = status
+
+def estimate_media_bytes(info):
+    """Estimate the combined size of a download's selected formats"""
+    duration = info.get('duration', 0)
+    total = 0
+    for fmt in info.get('requested_formats') or [info]:
+        size, _ = estimate_filesize(fmt, duration)
+        total += size or 0
+    return total or DEFAULT_DOWNLOAD_ESTIMATE
+
+def estimate_download_bytes(info, clip_share=None):
+    """Estimate the scratch space a download needs; clip_share is the part of
+    the video a clip covers (see clip_fraction), None for the whole video"""
+    if clip_share is not None:
+        # Clips go through ffmpeg, which writes video and audio straight into
+        # one output file: there are no separate inputs to merge
+        return int(estimate_media_bytes(info) * clip_share)
+    total = estimate_media_bytes(info)
+    # Merging separate video/audio streams writes the output next to its inputs
+    if info.get('requested_formats'):
+        total *= 2
+    return int(total)
+
+def parse_clip_range(start, end):
+    """Parse clip start/end (seconds or [HH:]MM:SS) into seconds; end may be open"""
+    start_s = parse_duration(start) if start else 0
+    end_s = parse_duration(end) if end else float('inf')
+    if start_s is None or end_s is None:
+        raise DownloadRejected('start and end must be seconds or [HH:]MM:SS', 400)
+    if end_s <= start_s:
+        raise DownloadRejected('end must be after start', 400)
+    return start_s, end_s
+
+def clip_fraction(clip, duration):
+    """Share of the video a clip covers; rejects clips that start past the end"""
+    start_s, end_s = clip
+    if not duration:
+        return 1.0
+    if start_s >= duration:
+        raise DownloadRejected(f'start is past the end of the video ({duration}s)', 400)
+    # Keyframe snapping can pull in a little extra on either side
+    return min(1.0, (min(end_s, duration) - start_s) / duration * 1.1)
+
+def share_download_budget(workers):
+    """Give this process its share of the host's scratch budget, since every
+    worker keeps its own reservations but they all write to the same /tmp"""
+    global DOWNLOAD_DISK_BUDGET
+    DOWNLOAD_DISK_BUDGET = TOTAL_DOWNLOAD_DISK_BUDGET // max(1, workers)
+
+def admit_download(nbytes, timeout=DOWNLOAD_QUEUE_TIMEOUT):
+    """Wait for a free download slot and reserve nbytes of scratch space"""
+    global _active_downloads, _queued_downloads, _reserved_bytes
+    if nbytes > DOWNLOAD_DISK_BUDGET:
+        raise DownloadRejected(
+            f'Video is too large to download here ({nbytes / (1024*1024):.0f} MB). Try a lower quality.', 413)
+    fits = lambda: _active_downloads < MAX_CONCURRENT_DOWNLOADS and _reserved_bytes + nbytes <= DOWNLOAD_DISK_BUDGET
+    with _admission:
+        if not fits():
+            # Only wait if a queue place is free; otherwise answer 503 straight away
+            if _queued_downloads >= MAX_QUEUED_DOWNLOADS:
+                raise DownloadRejected('Server is busy with other downloads. Please try again shortly.')
+            _queued_downloads += 1
+            try:
+                admitted = _admission.wait_for(fits, timeout=timeout)
+            finally:
+                _queued_downloads -= 1
+            if not admitted:
+                raise DownloadRejected('Server is busy with other downloads. Please try again shortly.')
+        _active_downloads += 1
+        _reserved_bytes += nbytes
+
+def release_download_slot():
+    """Free a concurrency slot once yt-dlp has finished writing"""
+    global _active_downloads
+    with _admission:
+        _active_downloads -= 1
+        _admission.notify_all()
+
+def release_scratch(temp_dir, nbytes):
+    """Remove a download's scratch directory and return its reserved bytes"""
+    global _reserved_bytes
+    if temp_dir:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    if nbytes:
+        with _admission:
+            _reserved_bytes -= nbytes
+            _admission.notify_all()
+
+def scratch_owner_alive(name):
+    """Whether the process that created a scratch directory (uth-dl-<pid>-...) still runs"""
+    pid = name[len(SCRATCH_PREFIX):].split('-', 1)[0]
+    if not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+def remove_orphaned_scratch_dirs(max_age=SCRATCH_MAX_AGE):
+    """Delete scratch directories left behind by crashed or killed workers:
+    any whose owning process is gone, and any older than max_age"""
+    root = tempfile.gettempdir()
+    now = time.time()
+    removed = 0
+    for name in os.listdir(root):
+        if not name.startswith(SCRATCH_PREFIX):
+            continue
+        path = os.path.join(root, name)
+        try:
+            if scratch_owner_alive(name) and now - os.path.getmtime(path) < max_age:
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+    if removed:
+        print(f'Removed {removed} orphaned download directories from {root}')
+    return removed
+
+remove_orphaned_scratch_dirs()
+
+
 @app.route('/api/youtube/download', methods=['GET'])
 def download_youtube():
     """Download YouTube video using yt-dlp and stream to client"""
     video_url = request.args.get('url')
     quality = request.args.get('quality', '360p')
     filename = request.args.get('filename', 'video.mp4')
+    # Optional clip: only the fragments/byte ranges covering start..end are fetched
+    start = request.args.get('start')
+    end = request.args.get('end')
+    precise = request.args.get('precise') == '1'
     
     if not video_url:
         return jsonify({'error': 'URL parameter required'}), 400
     
+    temp_dir = None
+    reserved = 0
+    
     try:
-        from flask import Response
-        import tempfile
-        import os
-        
+        clip = parse_clip_range(start, end) if (start or end) else None
+    
         # Clean URL to remove playlist params
-        video_id_match = re.search(r'(?:v=|/)([a-zA-Z0-9_-]{11})', video_url)
+        video_id_match = YOUTUBE_ID_RE.search(video_url)
         if video_id_match:
             video_id = video_id_match.group(1)
             video_url = f'https://www.youtube.com/watch?v={video_id}'
@@ -297,8 +1347,8 @@ def download_youtube():
         height = quality.replace('p', '')
         format_string = f'bestvideo[height<={height}]+bestaudio/best[height<={height}]'
         
-        # Create temp directory
-        temp_dir = tempfile.mkdtemp()
+        # Create temp directory (the janitor recognises it by its prefix and pid)
+        temp_dir = tempfile.mkdtemp(prefix=f'{SCRATCH_PREFIX}{os.getpid()}-')
         output_path = os.path.join(temp_dir, 'video.%(ext)s')
         
         ydl_opts = {
@@ -323,13 +1373,33 @@ def download_youtube():
             ],
         }
         
+        if clip:
+            # Cuts snap to keyframes so streams are copied, not re-encoded,
+            # unless the caller asks for frame-accurate (re-encoded) cuts
+            ydl_opts['download_ranges'] = download_range_func(None, [clip])
+            ydl_opts['force_keyframes_at_cuts'] = precise
+        
         print(f"\n{'='*60}")
         print(f"Downloading video at {quality} quality...")
         print(f"Format: {format_string}")
         print(f"{'='*60}\n")
         
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            result = ydl.download([video_url])
+            # Resolve formats first so we know how much disk to reserve
+            with stage('extract_info'):
+                info = ydl.extract_info(video_url, download=False)
+            full_size = estimate_media_bytes(info)
+            clip_share = clip_fraction(clip, info.get('duration')) if clip else None
+            needed = estimate_download_bytes(info, clip_share)
+            with stage('admission'):
+                admit_download(needed)
+            reserved = needed
+            print(f"Reserved {needed / (1024*1024):.1f} MB of scratch space")
+            try:
+                with stage('download'):
+                    ydl.process_ie_result(info, download=True)
+            finally:
+                release_download_slot()
         
         # Find the downloaded file
         downloaded_files = [f for f in os.listdir(temp_dir) if f.startswith('video.')]
@@ -340,21 +1410,40 @@ def download_youtube():
         file_size = os.path.getsize(downloaded_file)
         
         print(f"\n✓ Downloaded: {downloaded_files[0]}")
-        print(f"✓ Size: {file_size:,} bytes ({file_size/(1024*1024):.2f} MB)\n")
+        print(f"✓ Size: {file_size:,} bytes ({file_size/(1024*1024):.2f} MB)")
+        print(f"✓ Full video is ~{full_size/(1024*1024):.2f} MB\n")
         
         if file_size == 0:
             raise Exception('Downloaded file is empty')
         
-        # Use send_file for proper file delivery
-        from flask import send_file
-        return send_file(
+        # Use send_file for proper file delivery; scratch is removed once the
+        # response is closed, whether it finished or the client disconnected
+        response = send_file(
             downloaded_file,
             mimetype='video/mp4',
             as_attachment=True,
             download_name=filename
         )
+        # Size of the file we send vs. the whole video; yt-dlp's ffmpeg
+        # downloader (used for clips) reports only output size, not transfer
+        response.headers['X-Output-Size'] = str(file_size)
+        response.headers['X-Full-Size-Estimate'] = str(full_size)
+        # send_file sets direct_passthrough, which makes Werkzeug skip the
+        # response's close callbacks; iterate the file normally so the
+        # scratch dir and its reservation are released when the stream ends
+        response.direct_passthrough = False
+        scratch_dir, scratch_bytes = temp_dir, reserved
+        response.call_on_close(lambda: release_scratch(scratch_dir, scratch_bytes))
+        return response
+    
+    except DownloadRejected as e:
+        release_scratch(temp_dir, reserved)
+        print(f'\nDownload rejected: {str(e)}')
+        headers = {'Retry-After': str(int(DOWNLOAD_QUEUE_TIMEOUT))} if e.status == 503 else {}
+        return jsonify({'error': str(e)}), e.status, headers
             
     except Exception as e:
+        release_scratch(temp_dir, reserved)
         print(f'\nDownload error: {str(e)}')
         print(f'Traceback: {traceback.format_exc()}')
         return jsonify({'error': f'Download failed: {str(e)}'}), 500
@@ -371,7 +1460,10 @@ def root():
         'status': 'active',
         'endpoints': {
             '/api/instagram': 'Instagram Post Downloader',
+            '/api/instagram/bundle': 'Instagram carousel ZIP bundle',
+            '/api/instagram/media': 'Range-capable Instagram media proxy',
             '/api/youtube': 'YouTube Video Downloader',
+            '/api/youtube/manifest': 'DASH manifest for previewing a video from the CDN',
             '/health': 'Health check'
         }
     }), 200
@@ -410,13 +1502,50 @@ def health():
     }), 200
 
 
+# =============================================================================
+# WORKER LIFECYCLE
+# =============================================================================
+# Under a pre-forking server (gunicorn.conf.py + wsgi.py) this module is
+# imported once in the master and workers fork from it, so anything built at
+# import time is shared copy-on-write. Sockets, threads and caches are not
+# safe to share and are rebuilt per worker in init_worker().
+
+def preload_extractors():
+    """Compile every yt-dlp extractor's URL pattern now rather than on each
+    worker's first lookup (~0.5 s of CPU per process otherwise)"""
+    for ie in gen_extractor_classes():
+        ie.suitable('')
+
+def init_worker():
+    """Rebuild per-process state in a freshly forked worker"""
+    global media_session
+    media_session = new_media_session()
+    clear_ydl_pool()
+    warm_ydl_pool()
+    result_cache.clear()
+    hot_keys.clear()
+    # The master only swept /tmp once at import; a worker replacing one that
+    # crashed or timed out mid-download clears what that one left behind
+    remove_orphaned_scratch_dirs()
+    start_prefetcher()
+
+@app.before_request
+def ensure_prefetcher():
+    # Threads don't survive fork; start lazily in whichever process serves
+    # requests so a pre-fork master never runs one of its own
+    start_prefetcher()
+
+
 if __name__ == '__main__':
     print('\n' + '='*60)
     print('🚀 UNIFIED LOCAL DEVELOPMENT BACKEND')
     print('='*60)
     print('\n📍 Endpoints available:')
     print('   • http://localhost:5000/api/instagram')
+    print('   • http://localhost:5000/api/instagram/bundle')
+    print('   • http://localhost:5000/api/instagram/media')
     print('   • http://localhost:5000/api/youtube')
+    print('   • http://localhost:5000/api/youtube/manifest')
     print('   • http://localhost:5000/health')
     print('\n💡 Make sure your frontend is using localhost:5000')
     print('='*60 + '\n')
@@ -0,0 +1,312 @@
+"""
+Load test for backend.py
+Drives /api/youtube, /api/youtube/download and /api/instagram against the
+stand-in upstreams in stub_backend.py, ramping concurrency until latency or
+errors collapse, for each serving model that is installed:
+
+  flask     Flask/Werkzeug dev server (threaded)
+  threaded  gunicorn gthread workers
+  prefork   gunicorn sync workers
+  async     gunicorn gevent workers
+
+Each step reports throughput, tail latency, RSS and open file descriptors
+summed over the server's process tree (read from /proc, so Linux only).
+
+Run with: python bench/loadtest.py --models flask,prefork --latency-ms 200
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import string
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+STUB = os.path.join(BENCH_DIR, 'stub_backend.py')
+
+# Serving model -> modules it needs
+MODELS = {
+    'flask': (),
+    'threaded': ('gunicorn',),
+    'prefork': ('gunicorn',),
+    'async': ('gunicorn', 'gevent'),
+}
+
+
+# =============================================================================
+# SERVER PROCESSES
+# =============================================================================
+
+def server_command(model, port, args):
+    if model == 'flask':
+        return [sys.executable, STUB, 'serve', '--port', str(port)]
+    cmd = [sys.executable, '-m', 'gunicorn', '--chdir', BENCH_DIR,
+           '-b', f'127.0.0.1:{port}', '-w', str(args.workers),
+           '--timeout', '120', '--log-level', 'warning']
+    if model == 'threaded':
+        cmd += ['-k', 'gthread', '--threads', str(args.threads)]
+    elif model == 'async':
+        cmd += ['-k', 'gevent', '--worker-connections', '1000']
+    return cmd + ['stub_backend:app']
+
+
+def wait_until_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def process_tree(pid):
+    """pid plus every descendant, found by walking /proc parent links"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        tree.append(p)
+        stack.extend(children.get(p, []))
+    return tree
+
+
+def resource_usage(pid):
+    """(RSS in MB, open file descriptors) summed over a process tree"""
+    rss_kb, fds = 0, 0
+    for p in process_tree(pid):
+        try:
+            with open(f'/proc/{p}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss_kb += int(line.split()[1])
+            fds += len(os.listdir(f'/proc/{p}/fd'))
+        except OSError:
+            continue
+    return rss_kb / 1024, fds
+
+
+# =============================================================================
+# LOAD GENERATION
+# =============================================================================
+
+def random_id(length):
+    return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
+
+
+def build_request(endpoint):
+    if endpoint == 'youtube':
+        return f'/api/youtube?url=https://www.youtube.com/watch?v={random_id(11)}'
+    if endpoint == 'download':
+        return f'/api/youtube/download?url=https://www.youtube.com/watch?v={random_id(11)}&quality=360p'
+    return f'/api/instagram?url=https://www.instagram.com/p/{random_id(11)}/'
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[int(round(pct / 100 * (len(sorted_values) - 1)))]
+
+
+def run_step(base_url, concurrency, duration, mix, timeout):
+    """Closed-loop load: `concurrency` clients issue requests back to back"""
+    endpoints, weights = zip(*mix.items())
+    deadline = time.monotonic() + duration
+    results = []
+    lock = threading.Lock()
+
+    def client():
+        session = requests.Session()
+        local = []
+        while time.monotonic() < deadline:
+            endpoint = random.choices(endpoints, weights)[0]
+            start = time.perf_counter()
+            try:
+                with session.get(base_url + build_request(endpoint), timeout=timeout, stream=True) as response:
+                    for _ in response.iter_content(64 * 1024):
+                        pass
+                    status = response.status_code
+            except requests.RequestException:
+                status = None
+            local.append((endpoint, status, time.perf_counter() - start))
+        with lock:
+            results.extend(local)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    latencies = sorted(lat * 1000 for _, status, lat in results if status == 200)
+    ok = len(latencies)
+    rejected = sum(1 for _, status, _ in results if status == 503)
+    errors = len(results) - ok - rejected
+    return {
+        'concurrency': concurrency,
+        'requests': len(results),
+        'ok': ok,
+        'rejected': rejected,
+        'errors': errors,
+        'rps': ok / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+    }
+
+
+def ramp(base_url, pid, args, mix):
+    """Double concurrency until p99, error rate or throughput says we're saturated"""
+    steps = []
+    best_rps = 0.0
+    concurrency = args.start_concurrency
+    while concurrency <= args.max_concurrency:
+        step = run_step(base_url, concurrency, args.step_seconds, mix, args.request_timeout)
+        step['rss_mb'], step['open_fds'] = resource_usage(pid)
+        steps.append(step)
+        print_step(step)
+
+        failed = step['errors'] + step['rejected']
+        if step['requests'] and failed / step['requests'] > args.max_error_rate:
+            print('  -> saturated: error rate')
+            break
+        if step['p99_ms'] > args.max_p99_ms:
+            print('  -> saturated: p99 latency')
+            break
+        if best_rps and step['rps'] < best_rps * 1.05:
+            print('  -> saturated: throughput stopped growing')
+            break
+        best_rps = max(best_rps, step['rps'])
+        concurrency *= 2
+    return steps
+
+
+# =============================================================================
+# REPORTING
+# =============================================================================
+
+HEADER = f"{'conc':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'503':>5} {'err':>5} {'rss MB':>8} {'fds':>5}"
+
+
+def print_step(step):
+    print(f"{step['concurrency']:>6} {step['rps']:>8.1f} {step['p50_ms']:>8.0f} {step['p95_ms']:>8.0f} "
+          f"{step['p99_ms']:>8.0f} {step['rejected']:>5} {step['errors']:>5} {step['rss_mb']:>8.1f} {step['open_fds']:>5}")
+
+
+def print_summary(report):
+    print(f"\n{'='*60}")
+    print(f"{'model':<10} {'peak rps':>9} {'at conc':>8} {'p99 ms':>8} {'max rss':>8} {'max fds':>8}")
+    for model, steps in report.items():
+        if not steps:
+            print(f'{model:<10} {"skipped":>9}')
+            continue
+        peak = max(steps, key=lambda s: s['rps'])
+        print(f"{model:<10} {peak['rps']:>9.1f} {peak['concurrency']:>8} {peak['p99_ms']:>8.0f} "
+              f"{max(s['rss_mb'] for s in steps):>8.1f} {max(s['open_fds'] for s in steps):>8}")
+    print('='*60)
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('youtube', 'download', 'instagram'):
+            raise argparse.ArgumentTypeError(f'unknown endpoint: {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test backend.py against stand-in upstreams')
+    parser.add_argument('--models', default=','.join(MODELS), help='comma-separated serving models')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('youtube=6,instagram=3,download=1'),
+                        help='endpoint weights, e.g. youtube=6,instagram=3,download=1')
+    parser.add_argument('--latency-ms', type=float, default=200, help='artificial upstream latency')
+    parser.add_argument('--image-kb', type=float, default=150, help='size of each Instagram image')
+    parser.add_argument('--carousel-items', type=int, default=5, help='items per Instagram post')
+    parser.add_argument('--download-mb', type=float, default=5, help='size of each YouTube download')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=16, help='threads per gthread worker')
+    parser.add_argument('--start-concurrency', type=int, default=1)
+    parser.add_argument('--max-concurrency', type=int, default=256)
+    parser.add_argument('--step-seconds', type=float, default=10)
+    parser.add_argument('--request-timeout', type=float, default=60)
+    parser.add_argument('--max-p99-ms', type=float, default=10000, help='p99 that counts as collapse')
+    parser.add_argument('--max-error-rate', type=float, default=0.05)
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--upstream-port', type=int, default=9100)
+    parser.add_argument('--json', help='also write the full report to this file')
+    args = parser.parse_args()
+
+    env = {
+        **os.environ,
+        'UTH_STUB_UPSTREAM': f'http://127.0.0.1:{args.upstream_port}',
+        'UTH_STUB_LATENCY_MS': str(args.latency_ms),
+        'UTH_STUB_IMAGE_KB': str(args.image_kb),
+        'UTH_STUB_CAROUSEL_ITEMS': str(args.carousel_items),
+        'UTH_STUB_DOWNLOAD_MB': str(args.download_mb),
+    }
+    upstream = subprocess.Popen([sys.executable, STUB, 'upstream', '--port', str(args.upstream_port)],
+                                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    report = {}
+    try:
+        for model in args.models.split(','):
+            if model not in MODELS:
+                print(f'Unknown model {model}, skipping')
+                continue
+            missing = [m for m in MODELS[model] if importlib.util.find_spec(m) is None]
+            if missing:
+                print(f"\n{model}: {', '.join(missing)} not installed, skipping")
+                report[model] = []
+                continue
+
+            print(f"\n=== {model} ===")
+            server = subprocess.Popen(server_command(model, args.port, args), env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            base_url = f'http://127.0.0.1:{args.port}'
+            try:
+                if not wait_until_ready(f'{base_url}/health'):
+                    print('Server did not start, skipping')
+                    report[model] = []
+                    continue
+                rss_mb, fds = resource_usage(server.pid)
+                print(f'idle: {rss_mb:.1f} MB RSS, {fds} fds')
+                print(HEADER)
+                report[model] = ramp(base_url, server.pid, args, args.mix)
+            finally:
+                server.terminate()
+                try:
+                    server.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+    finally:
+        upstream.terminate()
+
+    print_summary(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args) | {'mix': args.mix}, 'models': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
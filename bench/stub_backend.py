@@ -0,0 +1,172 @@
+"""
+Stand-in upstreams for load testing backend.py
+Swaps yt-dlp and Instagram lookups for local fakes with configurable latency
+and payload sizes, so the load test measures our server rather than YouTube.
+
+Run the fake CDN:      python bench/stub_backend.py upstream --port 9100
+Run the Flask server:  python bench/stub_backend.py serve --port 9000
+Under gunicorn:        gunicorn --chdir bench stub_backend:app
+
+Configured through environment variables (bench/loadtest.py sets these):
+  UTH_STUB_UPSTREAM        base URL of the fake CDN (default http://127.0.0.1:9100)
+  UTH_STUB_LATENCY_MS      artificial latency per upstream call (default 200)
+  UTH_STUB_IMAGE_KB        size of each Instagram image (default 150)
+  UTH_STUB_CAROUSEL_ITEMS  items per Instagram post (default 5)
+  UTH_STUB_DOWNLOAD_MB     size of each YouTube download (default 5)
+"""
+
+import argparse
+import os
+import sys
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+UPSTREAM = os.environ.get('UTH_STUB_UPSTREAM', 'http://127.0.0.1:9100')
+LATENCY = float(os.environ.get('UTH_STUB_LATENCY_MS', 200)) / 1000
+IMAGE_BYTES = int(float(os.environ.get('UTH_STUB_IMAGE_KB', 150)) * 1024)
+CAROUSEL_ITEMS = int(os.environ.get('UTH_STUB_CAROUSEL_ITEMS', 5))
+DOWNLOAD_BYTES = int(float(os.environ.get('UTH_STUB_DOWNLOAD_MB', 5)) * 1024 * 1024)
+
+CHUNK = b'\0' * (64 * 1024)
+
+
+# =============================================================================
+# FAKE CDN
+# =============================================================================
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    """Serves /media?size=N after the configured latency"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        size = int(query.get('size', [IMAGE_BYTES])[0])
+        time.sleep(LATENCY)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        remaining = size
+        while remaining > 0:
+            chunk = CHUNK[:min(remaining, len(CHUNK))]
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_upstream(port):
+    server = ThreadingHTTPServer(('127.0.0.1', port), UpstreamHandler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+# =============================================================================
+# FAKE YT-DLP / INSTALOADER
+# =============================================================================
+
+class StubYoutubeDL:
+    """Mimics the parts of yt_dlp.YoutubeDL that backend.py uses"""
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def close(self):
+        pass
+
+    def get_info_extractor(self, ie_key):
+        return None
+
+    cookiejar = None
+
+    def extract_info(self, url, download=False):
+        time.sleep(LATENCY)
+        formats = []
+        for height in (144, 240, 360, 480, 720, 1080):
+            for has_audio in (False, True):
+                formats.append({
+                    'format_id': f'{height}{"a" if has_audio else "v"}',
+                    'ext': 'mp4',
+                    'height': height,
+                    'vcodec': 'avc1',
+                    'acodec': 'mp4a' if has_audio else 'none',
+                    'filesize': height * 10000,
+                    'url': f'{UPSTREAM}/media?size={DOWNLOAD_BYTES}',
+                })
+        info = {
+            'id': url[-11:],
+            'title': 'Load test video',
+            'uploader': 'Load test',
+            'duration': 600,
+            'view_count': 1000,
+            'thumbnail': f'{UPSTREAM}/media?size=1024',
+            'formats': formats,
+            'requested_formats': [
+                {'filesize': DOWNLOAD_BYTES // 2, 'height': 360},
+                {'filesize': DOWNLOAD_BYTES // 2},
+            ],
+        }
+        if download:
+            self.process_ie_result(info, download=True)
+        return info
+
+    def process_ie_result(self, info, download=True):
+        outtmpl = self.params.get('outtmpl', 'video.%(ext)s')
+        if isinstance(outtmpl, dict):
+            outtmpl = outtmpl.get('default', 'video.%(ext)s')
+        path = outtmpl.replace('%(ext)s', 'mp4')
+        with requests.get(f'{UPSTREAM}/media?size={DOWNLOAD_BYTES}', stream=True, timeout=60) as response:
+            with open(path, 'wb') as f:
+                for chunk in response.iter_content(64 * 1024):
+                    f.write(chunk)
+        return info
+
+
+class StubPost:
+    typename = 'GraphSidecar'
+    mediacount = CAROUSEL_ITEMS
+
+    def get_sidecar_nodes(self):
+        for i in range(CAROUSEL_ITEMS):
+            yield types.SimpleNamespace(
+                is_video=False,
+                display_url=f'{UPSTREAM}/media?size={IMAGE_BYTES}&i={i}',
+            )
+
+
+def stub_fetch_post(shortcode, max_retries=2):
+    time.sleep(LATENCY)
+    return StubPost()
+
+
+import backend  # noqa: E402  (needs sys.path set up above)
+
+backend.yt_dlp.YoutubeDL = StubYoutubeDL
+backend.fetch_post_with_retry = stub_fetch_post
+backend.clear_ydl_pool()
+backend.warm_ydl_pool()
+app = backend.app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('role', choices=['upstream', 'serve'])
+    parser.add_argument('--port', type=int, required=True)
+    args = parser.parse_args()
+
+    if args.role == 'upstream':
+        run_upstream(args.port)
+    else:
+        app.run(host='127.0.0.1', port=args.port, threaded=True)
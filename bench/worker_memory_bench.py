@@ -0,0 +1,121 @@
+"""
+Worker memory and startup benchmark for the production server
+Starts gunicorn with gunicorn.conf.py and wsgi.py, with and without
+preload_app, and reports how long it takes until /health first answers,
+plus each process's memory from /proc/<pid>/smaps_rollup:
+
+  RSS      resident pages, counting shared ones in full
+  PSS      shared pages split between the processes sharing them
+  private  pages only this process maps (what a new worker really costs)
+
+Linux only. No upstream requests are made (UTH_PREFETCH=0).
+
+Run with: python bench/worker_memory_bench.py --workers 4
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import requests
+
+from loadtest import process_tree, wait_until_ready
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def memory_kb(pid):
+    """(RSS, PSS, private) in kB for one process"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[name] = int(value.split()[0])
+    private = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    return fields.get('Rss', 0), fields.get('Pss', 0), private
+
+
+def touch_workers(base_url, workers):
+    """Send a few requests per worker over fresh connections so each one serves some"""
+    for _ in range(workers * 5):
+        try:
+            requests.get(f'{base_url}/health', timeout=5)
+        except requests.RequestException:
+            pass
+
+
+def run(preload, args):
+    env = {
+        **os.environ,
+        'PORT': str(args.port),
+        'WEB_CONCURRENCY': str(args.workers),
+        'UTH_PRELOAD': '1' if preload else '0',
+        'UTH_PREFETCH': '0',
+    }
+    started = time.monotonic()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{args.port}'
+    try:
+        if not wait_until_ready(f'{base_url}/health', timeout=120):
+            raise RuntimeError('server did not start')
+        first_ready = time.monotonic() - started
+        touch_workers(base_url, args.workers)
+        time.sleep(args.settle)
+
+        pids = process_tree(server.pid)
+        master, workers = pids[0], pids[1:]
+        worker_mem = [memory_kb(pid) for pid in workers]
+        result = {
+            'preload': preload,
+            'startup_s': first_ready,
+            'master': memory_kb(master),
+            'workers': worker_mem,
+            'total_pss_kb': memory_kb(master)[1] + sum(m[1] for m in worker_mem),
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return result
+
+
+def print_result(result):
+    mb = lambda kb: kb / 1024
+    label = 'preload' if result['preload'] else 'no preload'
+    workers = result['workers']
+    print(f"\n=== {label} ===")
+    print(f"ready after {result['startup_s']:.2f}s")
+    print(f"{'':<10} {'RSS MB':>8} {'PSS MB':>8} {'private':>8}")
+    rss, pss, private = result['master']
+    print(f"{'master':<10} {mb(rss):>8.1f} {mb(pss):>8.1f} {mb(private):>8.1f}")
+    for i, (rss, pss, private) in enumerate(workers):
+        print(f"{f'worker {i}':<10} {mb(rss):>8.1f} {mb(pss):>8.1f} {mb(private):>8.1f}")
+    print(f"total PSS {mb(result['total_pss_kb']):.1f} MB, "
+          f"{mb(sum(w[2] for w in workers) / len(workers)):.1f} MB private per worker")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare worker memory and startup with and without preload')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=9300)
+    parser.add_argument('--settle', type=float, default=2, help='seconds to wait before sampling memory')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = [run(preload, args) for preload in (False, True)]
+    for result in results:
+        print_result(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
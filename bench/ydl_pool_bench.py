@@ -0,0 +1,109 @@
+"""
+YoutubeDL pool overhead benchmark
+Measures the per-request setup cost /api/youtube pays before any network I/O:
+building a fresh YoutubeDL (option parsing, extractor lookup, cookie jar) versus
+checking a warm instance out of backend.py's pool. No requests are made.
+
+Runs twice: sequential checkouts, then --threads callers at once, each holding
+its instance for --hold-ms (standing in for extract_info) so the pool is
+contended the way it is under a threaded server.
+
+Run with: python bench/ydl_pool_bench.py --iterations 200 --threads 8
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend  # noqa: E402
+import yt_dlp  # noqa: E402
+
+
+@contextmanager
+def fresh_checkout():
+    with yt_dlp.YoutubeDL(dict(backend.YDL_INFO_OPTS)) as ydl:
+        ydl.get_info_extractor('Youtube')
+        ydl.cookiejar
+        yield ydl
+
+
+@contextmanager
+def pooled_checkout():
+    with backend.pooled_ydl() as ydl:
+        ydl.get_info_extractor('Youtube')
+        yield ydl
+
+
+def summarize(timings):
+    timings.sort()
+    return {
+        'mean': statistics.mean(timings),
+        'p50': timings[len(timings) // 2],
+        'p99': timings[int(len(timings) * 0.99) - 1],
+        'max': timings[-1],
+    }
+
+
+def measure(checkout, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        with checkout():
+            timings.append((time.perf_counter() - start) * 1000)
+    return summarize(timings)
+
+
+def measure_concurrent(checkout, iterations, threads, hold_ms):
+    """Checkout latency with `threads` callers each holding an instance for hold_ms"""
+    timings = []
+    lock = threading.Lock()
+
+    def caller():
+        local = []
+        for _ in range(max(1, iterations // threads)):
+            start = time.perf_counter()
+            with checkout():
+                local.append((time.perf_counter() - start) * 1000)
+                time.sleep(hold_ms / 1000)
+        with lock:
+            timings.extend(local)
+
+    workers = [threading.Thread(target=caller) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return summarize(timings)
+
+
+def print_table(title, rows):
+    print(title)
+    print(f"{'':<10} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, stats in rows:
+        print(f"{name:<10} {stats['mean']:>9.3f} {stats['p50']:>9.3f} {stats['p99']:>9.3f} {stats['max']:>9.3f}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare fresh vs pooled YoutubeDL setup cost')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8, help='concurrent callers for the contended run')
+    parser.add_argument('--hold-ms', type=float, default=50, help='how long each caller keeps its instance')
+    args = parser.parse_args()
+
+    backend.warm_ydl_pool()
+    print(f'yt-dlp {yt_dlp.version.__version__}, pool size {backend.YDL_POOL_SIZE}, {args.iterations} iterations\n')
+    checkouts = (('fresh', fresh_checkout), ('pooled', pooled_checkout))
+    print_table('sequential', [(name, measure(fn, args.iterations)) for name, fn in checkouts])
+    print_table(f'{args.threads} threads, {args.hold_ms:.0f} ms hold',
+                [(name, measure_concurrent(fn, args.iterations, args.threads, args.hold_ms)) for name, fn in checkouts])
+
+
+if __name__ == '__main__':
+    main()
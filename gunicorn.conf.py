@@ -0,0 +1,54 @@
+"""
+Production server config for backend.py
+Run with: gunicorn -c gunicorn.conf.py wsgi:app
+
+Configured through environment variables:
+  PORT               port to listen on (default 5000)
+  WEB_CONCURRENCY    worker processes (default 2)
+  UTH_THREADS        threads per worker (default 8)
+  UTH_MAX_REQUESTS   recycle a worker after this many requests (default 1000, 0 = never)
+  UTH_PRELOAD        import the app once in the master before forking (default 1)
+
+Admission control, caches and the YoutubeDL pool are per worker.
+UTH_DOWNLOAD_DISK_BUDGET_MB is for the whole host and is split evenly between
+workers; UTH_MAX_CONCURRENT_DOWNLOADS applies to each one.
+
+A running download, and one queued for a slot (up to
+UTH_DOWNLOAD_QUEUE_TIMEOUT seconds), each hold one of the worker's
+UTH_THREADS. UTH_MAX_QUEUED_DOWNLOADS is therefore capped at
+UTH_THREADS - UTH_MAX_CONCURRENT_DOWNLOADS - 2, so at least two threads stay
+free for lookups and the media proxy. With the defaults (8 threads,
+2 concurrent) that is 4 queued; beyond that downloads get a 503 at once.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('UTH_THREADS', 8))
+
+preload_app = os.environ.get('UTH_PRELOAD', '1') != '0'
+
+# Recycle workers to cap slow growth (yt-dlp/instaloader state, fragmentation);
+# jitter keeps them from all restarting at once
+max_requests = int(os.environ.get('UTH_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+# Downloads can run for minutes: give in-flight ones time to finish on recycle
+timeout = 120
+graceful_timeout = 120
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    import backend
+    # Workers share one /tmp, so each gets its slice of the scratch budget
+    backend.share_download_budget(server.cfg.workers)
+    # Sockets, threads and caches inherited from the master must not be shared;
+    # without preload there is nothing inherited, but the worker still needs its
+    # YoutubeDL pool warmed and its scratch swept
+    backend.init_worker()
@@ -17,12 +17,35 @@ const imageFormatGroup = document.getElementById('imageFormatGroup');
 const videoFormatGroup = document.getElementById('videoFormatGroup');
 
 let currentMedia = [];
+let currentShortcode = null;
 let selectedIndices = new Set();
 
 function isValidInstagramUrl(url) {
     return /^https?:\/\/(www\.)?instagram\.com\/(p|reel)\/[A-Za-z0-9_-]+\/?/.test(url);
 }
 
+// Route CDN media through the backend so it can be seeked/resumed without CORS issues
+function proxiedMediaUrl(url, filename) {
+    let proxyUrl = `${API_CONFIG.BACKEND_URL}/api/instagram/media?url=${encodeURIComponent(url)}`;
+    if (filename) proxyUrl += `&filename=${encodeURIComponent(filename)}`;
+    return proxyUrl;
+}
+
+// The proxy may be down or cold; probe it with a one-byte Range request first
+async function proxyAvailable(url) {
+    try {
+        const response = await fetch(proxiedMediaUrl(url), { headers: { Range: 'bytes=0-0' } });
+        return response.ok;
+    } catch {
+        return false;
+    }
+}
+
+function extractShortcode(url) {
+    const m = url.match(/\/(p|reel)\/([A-Za-z0-9_-]+)/);
+    return m ? m[2] : null;
+}
+
 function showError(message) {
     errorText.innerHTML = `${message} <a href="troubleshooting.html" target="_blank" style="color: var(--primary-light); text-decoration: underline;">Need help?</a>`;
     errorMsg.classList.add('active');
@@ -39,19 +62,26 @@ async function fetchInstagramMedia(url) {
     fetchBtn.disabled = true;
 
     try {
-        const response = await fetch(`${API_CONFIG.BACKEND_URL}/api/instagram?url=${encodeURIComponent(url)}`);
+        const response = await fetch(`${API_CONFIG.BACKEND_URL}/api/instagram?url=${encodeURIComponent(url)}&stream=1`);
 
         if (!response.ok) {
             const errorData = await response.json();
             throw new Error(errorData.error || 'Failed to fetch Instagram media');
         }
 
-        const data = await response.json();
-        if (!data.success || !data.media || data.media.length === 0) {
-            throw new Error('No media found in this post');
+        currentShortcode = extractShortcode(url);
+
+        // Older backends ignore stream=1 and answer with a single JSON document
+        if (!(response.headers.get('Content-Type') || '').includes('ndjson')) {
+            const data = await response.json();
+            if (!data.success || !data.media || data.media.length === 0) {
+                throw new Error('No media found in this post');
+            }
+            displayMedia(data.media);
+            return;
         }
 
-        displayMedia(data.media);
+        await readMediaStream(response);
     } catch (error) {
         if (error instanceof TypeError) {
             showError('Cannot connect to backend server. Please wait a moment and try again. The server may be starting up (cold start takes ~10s). <a href="troubleshooting.html" target="_blank" style="color: var(--primary-light); text-decoration: underline;">Need help?</a>');
@@ -65,75 +95,150 @@ async function fetchInstagramMedia(url) {
     }
 }
 
+// Render items as NDJSON lines arrive: meta (item count), item (one per line, any order), done
+async function readMediaStream(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let finished = false;
+
+    const handleLine = (line) => {
+        if (!line.trim()) return;
+        const message = JSON.parse(line);
+        if (message.type === 'meta') {
+            if (message.count === 0) throw new Error('No media found in this post');
+            startMediaGrid(message.count);
+        } else if (message.type === 'item') {
+            renderMediaItem(message.media, message.index);
+        } else if (message.type === 'done') {
+            finished = true;
+        }
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.forEach(handleLine);
+    }
+    handleLine(buffer);
+
+    // Connection dropped mid-stream: drop the slots that never arrived
+    if (!finished) {
+        imageGrid.querySelectorAll('.media-item.pending').forEach(el => el.remove());
+        if (!imageGrid.querySelector('.media-item')) throw new Error('Failed to fetch Instagram media');
+    }
+    finishMediaGrid();
+}
+
 function displayMedia(mediaArray) {
-    currentMedia = mediaArray;
+    startMediaGrid(mediaArray.length);
+    mediaArray.forEach((media, index) => renderMediaItem(media, index));
+    finishMediaGrid();
+}
+
+// Lay out one placeholder per item so the grid doesn't reflow as items arrive
+function startMediaGrid(count) {
+    currentMedia = new Array(count);
     selectedIndices.clear();
     imageGrid.innerHTML = '';
 
-    mediaArray.forEach((media, index) => {
-        const item = document.createElement('div');
-        item.className = 'media-item';
-        item.dataset.index = index;
-        item.dataset.type = media.type;
-
-        const checkbox = document.createElement('input');
-        checkbox.type = 'checkbox';
-        checkbox.className = 'media-checkbox';
-        checkbox.dataset.index = index;
-        checkbox.addEventListener('change', (e) => {
-            if (e.target.checked) {
-                selectedIndices.add(index);
-                item.classList.add('selected');
-            } else {
-                selectedIndices.delete(index);
-                item.classList.remove('selected');
-            }
-            updateDownloadButtons();
-        });
+    for (let index = 0; index < count; index++) {
+        const placeholder = document.createElement('div');
+        placeholder.className = 'media-item pending';
+        placeholder.dataset.index = index;
+        imageGrid.appendChild(placeholder);
+    }
+
+    loading.classList.remove('active');
+    results.classList.add('active');
+    updateDownloadButtons();
+    if (resultsCount) resultsCount.textContent = `Loading ${count} item${count > 1 ? 's' : ''}...`;
+}
+
+function renderMediaItem(media, index) {
+    currentMedia[index] = media;
 
-        let mediaElement;
-        if (media.type === 'video') {
-            mediaElement = document.createElement('video');
-            mediaElement.src = media.url_high;
-            mediaElement.controls = true;
-            mediaElement.poster = media.thumbnail;
-            mediaElement.style.width = '100%';
-            mediaElement.style.display = 'block';
+    const item = document.createElement('div');
+    item.className = 'media-item';
+    item.dataset.index = index;
+    item.dataset.type = media.type;
+
+    const checkbox = document.createElement('input');
+    checkbox.type = 'checkbox';
+    checkbox.className = 'media-checkbox';
+    checkbox.dataset.index = index;
+    checkbox.addEventListener('change', (e) => {
+        if (e.target.checked) {
+            selectedIndices.add(index);
+            item.classList.add('selected');
         } else {
-            mediaElement = document.createElement('img');
-            mediaElement.src = media.thumbnail;
-            mediaElement.alt = `Instagram ${media.type} ${index + 1}`;
-            mediaElement.loading = 'lazy';
+            selectedIndices.delete(index);
+            item.classList.remove('selected');
         }
+        updateDownloadButtons();
+    });
 
-        mediaElement.addEventListener('click', (e) => {
-            if (media.type === 'video' && e.target.tagName === 'VIDEO') return;
-            checkbox.checked = !checkbox.checked;
-            checkbox.dispatchEvent(new Event('change'));
-        });
+    let mediaElement;
+    if (media.type === 'video') {
+        mediaElement = document.createElement('video');
+        mediaElement.src = proxiedMediaUrl(media.url_high);
+        // If the proxy can't serve it, play from the CDN directly
+        mediaElement.addEventListener('error', () => { mediaElement.src = media.url_high; }, { once: true });
+        mediaElement.preload = 'metadata';
+        mediaElement.controls = true;
+        mediaElement.poster = media.thumbnail;
+        mediaElement.style.width = '100%';
+        mediaElement.style.display = 'block';
+    } else {
+        mediaElement = document.createElement('img');
+        mediaElement.src = media.thumbnail;
+        mediaElement.alt = `Instagram ${media.type} ${index + 1}`;
+        mediaElement.loading = 'lazy';
+    }
 
-        const badge = document.createElement('div');
-        badge.className = 'media-badge';
-        const typeIcon = media.type === 'video' ? '🎥 ' : '';
-        badge.textContent = `${typeIcon}${index + 1}/${mediaArray.length}`;
+    mediaElement.addEventListener('click', (e) => {
+        if (media.type === 'video' && e.target.tagName === 'VIDEO') return;
+        checkbox.checked = !checkbox.checked;
+        checkbox.dispatchEvent(new Event('change'));
+    });
 
-        item.appendChild(checkbox);
-        item.appendChild(mediaElement);
-        item.appendChild(badge);
+    const badge = document.createElement('div');
+    badge.className = 'media-badge';
+    const typeIcon = media.type === 'video' ? '🎥 ' : '';
+    badge.textContent = `${typeIcon}${index + 1}/${currentMedia.length}`;
+
+    item.appendChild(checkbox);
+    item.appendChild(mediaElement);
+    item.appendChild(badge);
+
+    const placeholder = imageGrid.querySelector(`.media-item.pending[data-index="${index}"]`);
+    if (placeholder) {
+        imageGrid.replaceChild(item, placeholder);
+    } else {
         imageGrid.appendChild(item);
-    });
+    }
+}
 
-    loading.classList.remove('active');
-    results.classList.add('active');
+// Items keep their post index (the bundle endpoint relies on it), so
+// currentMedia may have holes if the stream was cut short
+function loadedMedia() {
+    return currentMedia.filter(Boolean);
+}
+
+function finishMediaGrid() {
     fetchBtn.disabled = false;
     updateDownloadButtons();
 
     if (resultsCount) {
-        const imageCount = mediaArray.filter(m => m.type !== 'video').length;
-        const videoCount = mediaArray.filter(m => m.type === 'video').length;
+        const media = loadedMedia();
+        const imageCount = media.filter(m => m.type !== 'video').length;
+        const videoCount = media.filter(m => m.type === 'video').length;
         let countText = '';
         if (imageCount > 0 && videoCount > 0) {
-            countText = `${mediaArray.length} items (${imageCount} image${imageCount > 1 ? 's' : ''}, ${videoCount} video${videoCount > 1 ? 's' : ''})`;
+            countText = `${media.length} items (${imageCount} image${imageCount > 1 ? 's' : ''}, ${videoCount} video${videoCount > 1 ? 's' : ''})`;
         } else if (imageCount > 0) {
             countText = `${imageCount} image${imageCount > 1 ? 's' : ''} found`;
         } else {
@@ -151,8 +256,9 @@ function updateDownloadButtons() {
         Download Selected (${count})
     `;
 
-    if (selectAllBtn && currentMedia.length > 0) {
-        selectAllBtn.textContent = selectedIndices.size === currentMedia.length ? 'Deselect All' : 'Select All';
+    const loadedCount = loadedMedia().length;
+    if (selectAllBtn && loadedCount > 0) {
+        selectAllBtn.textContent = selectedIndices.size === loadedCount ? 'Deselect All' : 'Select All';
     }
     updateFormatDropdown();
 }
@@ -200,12 +306,20 @@ async function downloadFile(urlOrBase64, filename, format, mediaType) {
     try {
         let downloadData;
         if (mediaType === 'video') {
-            try {
-                const response = await fetch(urlOrBase64);
-                const blob = await response.blob();
-                downloadData = URL.createObjectURL(blob);
-            } catch {
+            if (urlOrBase64.startsWith('data:')) {
                 downloadData = urlOrBase64;
+            } else if (await proxyAvailable(urlOrBase64)) {
+                // The proxy sends Content-Disposition, so the browser streams straight to disk
+                downloadData = proxiedMediaUrl(urlOrBase64, filename);
+            } else {
+                // Fall back to the CDN directly
+                try {
+                    const response = await fetch(urlOrBase64);
+                    const blob = await response.blob();
+                    downloadData = URL.createObjectURL(blob);
+                } catch {
+                    downloadData = urlOrBase64;
+                }
             }
         } else {
             if (format !== 'jpg' && format !== 'original' && !urlOrBase64.includes('image/jpeg')) {
@@ -232,7 +346,7 @@ async function downloadFile(urlOrBase64, filename, format, mediaType) {
 }
 
 async function downloadAll() {
-    if (currentMedia.length === 0) { showError('No media to download'); return; }
+    if (loadedMedia().length === 0) { showError('No media to download'); return; }
     if (selectedIndices.size === 0) { showError('Please select images to download by clicking on them'); return; }
 
     const indicesToDownload = Array.from(selectedIndices).sort((a, b) => a - b);
@@ -240,6 +354,13 @@ async function downloadAll() {
     const videoFormat = videoFormatSelect.value;
     let successCount = 0;
 
+    // Several items in original format: let the server stream them as one ZIP
+    const needsConversion = imageFormat !== 'jpg' && indicesToDownload.some(i => currentMedia[i].type !== 'video');
+    if (indicesToDownload.length > 1 && currentShortcode && !needsConversion) {
+        downloadBundle(indicesToDownload, videoFormat);
+        return;
+    }
+
     for (let i = 0; i < indicesToDownload.length; i++) {
         const index = indicesToDownload[i];
         const media = currentMedia[index];
@@ -253,6 +374,17 @@ async function downloadAll() {
     }
 }
 
+function downloadBundle(indices, videoFormat) {
+    const bundleUrl = `${API_CONFIG.BACKEND_URL}/api/instagram/bundle?shortcode=${encodeURIComponent(currentShortcode)}&indices=${indices.join(',')}&video_ext=${encodeURIComponent(videoFormat)}`;
+    const a = document.createElement('a');
+    a.href = bundleUrl;
+    a.download = `instagram_${currentShortcode}.zip`;
+    a.style.display = 'none';
+    document.body.appendChild(a);
+    a.click();
+    setTimeout(() => document.body.removeChild(a), 100);
+}
+
 // Event listeners
 fetchBtn.addEventListener('click', () => {
     const url = instagramUrlInput.value.trim();
@@ -268,8 +400,9 @@ instagramUrlInput.addEventListener('keypress', (e) => {
 downloadBtn.addEventListener('click', () => downloadAll());
 
 selectAllBtn.addEventListener('click', () => {
-    if (currentMedia.length === 0) return;
-    const allSelected = selectedIndices.size === currentMedia.length;
+    const loadedCount = loadedMedia().length;
+    if (loadedCount === 0) return;
+    const allSelected = selectedIndices.size === loadedCount;
 
     if (allSelected) {
         selectedIndices.clear();
@@ -280,8 +413,8 @@ selectAllBtn.addEventListener('click', () => {
         });
     } else {
         selectedIndices.clear();
-        document.querySelectorAll('.media-item').forEach((item, index) => {
-            selectedIndices.add(index);
+        document.querySelectorAll('.media-item:not(.pending)').forEach(item => {
+            selectedIndices.add(Number(item.dataset.index));
             item.classList.add('selected');
             const cb = item.querySelector('.media-checkbox');
             if (cb) cb.checked = true;
@@ -0,0 +1,20 @@
+"""
+Production WSGI entry point for backend.py
+Imported once by the pre-fork master (preload_app in gunicorn.conf.py), so
+yt-dlp, instaloader, every extractor's URL regex and the app itself are
+built before workers fork and shared copy-on-write between them.
+
+Run with: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import gc
+
+import backend
+
+backend.preload_extractors()
+
+# Move everything loaded so far out of the collector's reach, so GC passes in
+# the workers don't touch (and un-share) the preloaded pages
+gc.freeze()
+
+app = backend.app